@@ -0,0 +1,191 @@
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+from openai import APIConnectionError, AsyncOpenAI, InternalServerError, RateLimitError
+
+from sources.article import Article
+from sources.extractor import estimate_tokens
+from .base import COMPLETION_TIMEOUT, Assistant
+from .news_assistant import NewsAssistant
+
+# Requests waiting for an answer at the same time
+DEFAULT_CONCURRENCY = 32
+# Budgets of the account, the defaults are those of gpt-4o-mini on usage tier 1
+DEFAULT_RPM = 500
+DEFAULT_TPM = 200000
+# Tokens a summary is expected to take, they count towards the budget as well
+EXPECTED_OUTPUT_TOKENS = 300
+# Attempts per summary when the API keeps answering 429 or failing transiently
+MAX_ATTEMPTS = 6
+# Seconds to back off after the first failed attempt, or 429 without Retry-After, doubled for each further one
+BACKOFF_BASE = 1.0
+# Errors worth another attempt besides 429: timeouts, connection errors and 5xx answers
+TRANSIENT_ERRORS = (APIConnectionError, InternalServerError)
+
+
+class TokenBucket:
+    """Budget refilling continuously at a rate per minute, holding at most one minute's worth."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until the amount is available."""
+        self._refill()
+        return max(0.0, (min(amount, self.capacity) - self.tokens) / self.rate)
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """Keeps requests within a requests-per-minute and a tokens-per-minute budget.
+
+    Must be used from a single event loop. Requests are let through in the
+    order they asked, so large ones are not starved by small ones.
+    """
+
+    def __init__(self, rpm: float, tpm: float):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int) -> None:
+        async with self._lock:
+            while True:
+                wait = max(self.paused_until - time.monotonic(), self.requests.wait_time(1),
+                           self.tokens.wait_time(tokens))
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            self.requests.take(1)
+            self.tokens.take(tokens)
+
+    def pause(self, seconds: float) -> None:
+        """Hold back all requests, after the API said we are over the limit."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def _retry_after(error: RateLimitError) -> Optional[float]:
+    headers = error.response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+class AsyncSummarizer:
+    """Summarizes many articles concurrently with chat completions on an event loop of its own.
+
+    Articles are submitted from any thread and get a concurrent.futures.Future,
+    so the summaries fit into the thread-based pipeline. Requests are held to
+    the RPM and TPM budgets, with tokens estimated from the text length, and
+    are retried with backoff when the API answers 429 anyway. The summaries are
+    cached like those of NewsAssistant.analyze_article.
+    """
+
+    def __init__(self, news_assistant: NewsAssistant, concurrency: int = DEFAULT_CONCURRENCY,
+                 rpm: float = DEFAULT_RPM, tpm: float = DEFAULT_TPM):
+        self.assistant = news_assistant
+        self.rate_limited = 0
+        # Lock and number of requests holding or waiting for it, per summary cache key
+        self._locks: Dict[str, List] = {}
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="summarizer", daemon=True)
+        self._thread.start()
+        self._run(self._setup(concurrency, rpm, tpm)).result()
+
+    async def _setup(self, concurrency: int, rpm: float, tpm: float) -> None:
+        # Created on the loop, older Pythons bind them to the loop of the creating thread
+        self.client = AsyncOpenAI(api_key=Assistant.api_key(), max_retries=0)
+        self.limiter = RateLimiter(rpm, tpm)
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    def _run(self, coroutine) -> Future:
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def submit(self, article: Article) -> Future:
+        """Summarize the article, the future is done once Article.summary or Article.error is set."""
+        return self._run(self._analyze(article))
+
+    def close(self) -> None:
+        self._run(self.client.close()).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    async def _analyze(self, article: Article) -> None:
+        loop = asyncio.get_running_loop()
+        # Cache reads and writes, and cleaning the HTML if needed, block, so they run off the loop
+        content, cache_key = await loop.run_in_executor(None, self.assistant.prepare, article)
+
+        entry = self._locks.setdefault(cache_key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                if await loop.run_in_executor(None, self.assistant.use_cached, article, cache_key):
+                    return
+
+                print(f"Summary generation: {article.source_url}")
+                try:
+                    result = await self._complete(content)
+                except Exception as e:
+                    article.error = f"assistant failed: {str(e)}"
+                    return
+                await loop.run_in_executor(None, self.assistant.store, article, cache_key, result)
+        finally:
+            # Later requests for the content find its summary in the cache
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[cache_key]
+
+    async def _complete(self, content: str) -> str:
+        tokens = estimate_tokens(self.assistant.instructions + content) + EXPECTED_OUTPUT_TOKENS
+        error: Exception = Exception(f"Rate limited {MAX_ATTEMPTS} times")
+        async with self._semaphore:
+            for attempt in range(MAX_ATTEMPTS):
+                await self.limiter.acquire(tokens)
+                start = time.perf_counter()
+                try:
+                    response = await self.client.chat.completions.create(
+                        model=self.assistant.model, messages=self.assistant.chat_messages(content),
+                        timeout=COMPLETION_TIMEOUT)
+                except RateLimitError as e:
+                    self.rate_limited += 1
+                    delay = _retry_after(e) or BACKOFF_BASE * 2 ** attempt
+                    # Jitter, so the waiting requests do not all come back at once
+                    self.limiter.pause(delay * (1 + random.random() / 4))
+                    continue
+                except TRANSIENT_ERRORS as e:
+                    error = e
+                    if attempt + 1 < MAX_ATTEMPTS:
+                        print(f"Summary request failed, retrying: {str(e)}")
+                        await asyncio.sleep(BACKOFF_BASE * 2 ** attempt * (1 + random.random() / 4))
+                    continue
+                self.assistant.record_latency(time.perf_counter() - start)
+                return response.choices[0].message.content or ""
+        raise error
@@ -1,14 +1,38 @@
 from pathlib import Path
-from typing import Dict, Any, Optional
-from openai import OpenAI
+from collections import deque
+from typing import Deque, Dict, Any, List, Optional
+from openai import NOT_GIVEN, BadRequestError, NotFoundError, OpenAI
+import threading
 import time
 
+from .registry import get_registry
+
+# "chat" sends one chat completion request per call, "assistants" a thread, message and run
+BACKENDS = ("chat", "assistants")
+DEFAULT_BACKEND = "chat"
+# Seconds a chat completion may take, the digest of a busy day takes a while
+COMPLETION_TIMEOUT = 300
+# Latest completion times kept for latency_stats(), a long-running daemon does not keep them all
+LATENCY_SAMPLES = 10000
+
 class Assistant:
     _api_key = None
 
-    def __init__(self, name: str, instructions: str, model: str = "gpt-4o-mini"):
+    def __init__(self, name: str, instructions: str, model: str = "gpt-4o-mini", backend: str = DEFAULT_BACKEND):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown LLM backend: {backend}")
         self.client = OpenAI(api_key=self.api_key())
-        self.assistant = self._create_assistant(name, instructions, model)
+        self.name = name
+        self.instructions = instructions
+        self.model = model
+        self.backend = backend
+        # Streaming is dropped for good once the API refuses it for the model
+        self.stream = True
+        # Looked up or created on first use, only the assistants backend needs one
+        self._assistant_id: Optional[str] = None
+        self._assistant_lock = threading.Lock()
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self._latencies_lock = threading.Lock()
 
     @classmethod
     def api_key(cls) -> str:
@@ -34,6 +58,104 @@ class Assistant:
 
         return cls._api_key
 
+    def complete(self, content: str, instructions: Optional[str] = None) -> str:
+        """Send the content with the instructions to the model and return its answer.
+
+        Other instructions can be given for single requests. Raises an exception
+        if the model does not answer.
+        """
+        start = time.perf_counter()
+        try:
+            if self.backend == "assistants":
+                return self._complete_assistants(content, instructions)
+            return self._complete_chat(content, instructions)
+        finally:
+            self.record_latency(time.perf_counter() - start)
+
+    def record_latency(self, seconds: float) -> None:
+        with self._latencies_lock:
+            self._latencies.append(seconds)
+
+    def latency_stats(self) -> Dict[str, float]:
+        """Number, mean, median, 95th percentile and maximum of the seconds the latest completions took."""
+        with self._latencies_lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return {"count": 0, "mean": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+        return {
+            "count": len(latencies),
+            "mean": sum(latencies) / len(latencies),
+            "p50": latencies[len(latencies) // 2],
+            "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+            "max": latencies[-1],
+        }
+
+    def chat_messages(self, content: str, instructions: Optional[str] = None) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": instructions or self.instructions},
+            {"role": "user", "content": content},
+        ]
+
+    def _complete_chat(self, content: str, instructions: Optional[str] = None) -> str:
+        messages = self.chat_messages(content, instructions)
+        if self.stream:
+            try:
+                stream = self.client.chat.completions.create(
+                    model=self.model, messages=messages, stream=True, timeout=COMPLETION_TIMEOUT)
+            except BadRequestError as e:
+                if "stream" not in str(e):
+                    raise
+                print(f"Streaming not available for {self.model}, sending plain requests")
+                self.stream = False
+            else:
+                parts = [chunk.choices[0].delta.content or "" for chunk in stream if chunk.choices]
+                return "".join(parts)
+
+        response = self.client.chat.completions.create(model=self.model, messages=messages, timeout=COMPLETION_TIMEOUT)
+        return response.choices[0].message.content or ""
+
+    def _complete_assistants(self, content: str, instructions: Optional[str] = None) -> str:
+        thread = self.client.beta.threads.create()
+        self.client.beta.threads.messages.create(
+            thread_id=thread.id,
+            role="user",
+            content=content,
+        )
+        try:
+            run = self.client.beta.threads.runs.create(
+                thread_id=thread.id,
+                assistant_id=self.assistant_id(),
+                instructions=instructions or NOT_GIVEN,
+            )
+        except NotFoundError:
+            # Deleted on the server since it was registered
+            self._forget_assistant()
+            run = self.client.beta.threads.runs.create(
+                thread_id=thread.id,
+                assistant_id=self.assistant_id(),
+                instructions=instructions or NOT_GIVEN,
+            )
+        run_result = self._wait_for_run(thread.id, run.id)
+        if run_result["status"] != "completed":
+            raise Exception(run_result.get("error", "Unknown error"))
+        return self._get_assistant_response(thread.id)
+
+    def assistant_id(self) -> str:
+        """ID of the assistant with our name, model and instructions, created if there is none yet."""
+        with self._assistant_lock:
+            if self._assistant_id is None:
+                self._assistant_id = get_registry().get_or_create(
+                    self.name, self.model, self.instructions,
+                    create=lambda: self._create_assistant(self.name, self.instructions, self.model).id,
+                    delete=lambda assistant_id: self.client.beta.assistants.delete(assistant_id),
+                )
+            return self._assistant_id
+
+    def _forget_assistant(self) -> None:
+        with self._assistant_lock:
+            self._assistant_id = None
+            get_registry().forget(self.name, self.model)
+
     def _create_assistant(self, name: str, instructions: str, model: str):
         """Create an OpenAI Assistant with specific tools and instructions."""
         return self.client.beta.assistants.create(
@@ -79,4 +201,4 @@ class Assistant:
         messages = self.client.beta.threads.messages.list(
             thread_id=thread_id
         )
-        return messages.data[0].content[0].text.value 
\ No newline at end of file
+        return messages.data[0].content[0].text.value 
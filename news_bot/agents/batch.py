@@ -0,0 +1,126 @@
+import io
+import json
+import os
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import cache
+from sources.article import Article
+from .news_assistant import NewsAssistant
+
+BATCHES_PATH = Path.home() / ".news-bot" / "batches.json"
+# The Batch API finishes jobs within this window, at half the price of single requests
+COMPLETION_WINDOW = "24h"
+ENDPOINT = "/v1/chat/completions"
+FAILED_STATUSES = {"failed", "expired", "cancelled"}
+
+
+def _load(path: Path) -> List[Dict]:
+    if not path.exists():
+        return []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error reading batch list {path}: {e}")
+        return []
+
+
+def _save(path: Path, batches: List[Dict]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(batches, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class BatchSubmitter:
+    """Collects the summary requests of a run and submits them as one job of the OpenAI Batch API.
+
+    Used in place of a summarizer in the pipeline: articles whose summary is
+    not cached are queued instead of summarized. close() submits the job,
+    collect_batches() puts its summaries into the cache once it is done.
+    """
+
+    def __init__(self, news_assistant: NewsAssistant, path: Path = BATCHES_PATH):
+        self.assistant = news_assistant
+        self.path = path
+        self.requests: Dict[str, str] = {}
+
+    def submit(self, article: Article) -> Future:
+        future: Future = Future()
+        content, cache_key = self.assistant.prepare(article)
+        if not self.assistant.use_cached(article, cache_key):
+            self.requests.setdefault(cache_key, content)
+        future.set_result(None)
+        return future
+
+    def close(self) -> Optional[str]:
+        """Submit the queued requests, returning the ID of the batch or None if there were none."""
+        if not self.requests:
+            return None
+        lines = [
+            json.dumps({
+                # Summaries are cached by content, the cache key identifies the request
+                "custom_id": cache_key,
+                "method": "POST",
+                "url": ENDPOINT,
+                "body": {"model": self.assistant.model, "messages": self.assistant.chat_messages(content)},
+            }, ensure_ascii=False)
+            for cache_key, content in self.requests.items()
+        ]
+        client = self.assistant.client
+        upload = client.files.create(file=("summaries.jsonl", io.BytesIO("\n".join(lines).encode('utf-8'))),
+                                     purpose="batch")
+        batch = client.batches.create(input_file_id=upload.id, endpoint=ENDPOINT, completion_window=COMPLETION_WINDOW)
+
+        batches = _load(self.path)
+        batches.append({"id": batch.id, "submitted": time.time(), "requests": len(self.requests)})
+        _save(self.path, batches)
+        return batch.id
+
+
+def collect_batches(news_assistant: NewsAssistant, path: Path = BATCHES_PATH) -> int:
+    """Put the summaries of finished batch jobs into the cache and forget those jobs.
+
+    Returns:
+        Number of summaries collected
+    """
+    entries = _load(path)
+    if not entries:
+        return 0
+    client = news_assistant.client
+    collected = 0
+    remaining = []
+    for entry in entries:
+        batch = client.batches.retrieve(entry["id"])
+        if batch.status in FAILED_STATUSES:
+            print(f"Batch {batch.id} {batch.status}, its articles are summarized in the next run")
+            continue
+        if batch.status != "completed":
+            counts = batch.request_counts
+            print(f"Batch {batch.id} {batch.status}: {counts.completed if counts else 0} of {entry['requests']} done")
+            remaining.append(entry)
+            continue
+
+        summaries = {}
+        failed = 0
+        if batch.output_file_id:
+            for line in client.files.content(batch.output_file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                result = json.loads(line)
+                response = result.get("response") or {}
+                if response.get("status_code") != 200:
+                    failed += 1
+                    continue
+                summary = response["body"]["choices"][0]["message"]["content"]
+                if summary:
+                    summaries[result["custom_id"]] = summary
+        cache.put_many(summaries)
+        collected += len(summaries)
+        print(f"Batch {batch.id}: {len(summaries)} summaries collected, {failed} failed")
+    _save(path, remaining)
+    return collected
@@ -0,0 +1,81 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, List
+
+# Cosine similarity above which an article joins a cluster
+SIMILARITY_THRESHOLD = 0.2
+# Articles per cluster, larger topics are split so each partial digest stays small
+MAX_CLUSTER_SIZE = 25
+# Clusters smaller than this are pooled with other small ones into mixed groups
+MIN_CLUSTER_SIZE = 3
+
+WORD_PATTERN = re.compile(r"[a-zäöüß0-9]{3,}")
+STOPWORDS = frozenset("""
+    aber alle allem allen aller alles als also am an ander andere anderen auch auf aus bei beim bis bisher
+    bereits damit dann darauf darum das dass dem den denen der des deshalb dessen die dies diese diesem diesen
+    dieser dieses doch dort durch ein eine einem einen einer eines einige er es etwa für gegen gibt hat hatte
+    haben hier ihm ihn ihr ihre ihrem ihren im in ins ist jedoch jetzt kann kein keine können man mehr mit
+    muss nach nicht noch nun nur oder ohne seit sich sie sind so soll sollen sowie über um und uns unter
+    viel vom von vor war waren was weil weiter wenn werden wie wieder wird wir wurde wurden zu zum zur zwei
+""".split())
+
+
+def vectorize(texts: List[str]) -> List[Dict[str, float]]:
+    """TF-IDF vectors of the texts, normalized to unit length."""
+    counts = [Counter(w for w in WORD_PATTERN.findall(text.lower()) if w not in STOPWORDS) for text in texts]
+    document_frequency = Counter(word for words in counts for word in words)
+    n = len(texts)
+    vectors = []
+    for words in counts:
+        vector = {word: (1 + math.log(count)) * math.log((1 + n) / (1 + document_frequency[word]))
+                  for word, count in words.items()}
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        vectors.append({word: v / norm for word, v in vector.items() if v > 0})
+    return vectors
+
+
+def _cosine(vector: Dict[str, float], centroid: Dict[str, float], centroid_norm: float) -> float:
+    if not centroid_norm:
+        return 0.0
+    if len(vector) > len(centroid):
+        vector, centroid = centroid, vector
+    return sum(v * centroid.get(word, 0.0) for word, v in vector.items()) / centroid_norm
+
+
+def cluster(texts: List[str], threshold: float = SIMILARITY_THRESHOLD, max_size: int = MAX_CLUSTER_SIZE,
+            min_size: int = MIN_CLUSTER_SIZE) -> List[List[int]]:
+    """Group texts by topic, returning lists of indexes into texts.
+
+    Each text joins the most similar cluster centroid above the threshold that
+    has room, or starts a new cluster. Clusters below min_size are pooled into
+    groups of up to max_size, so unrelated single articles do not each get a
+    request of their own.
+    """
+    vectors = vectorize(texts)
+    clusters: List[List[int]] = []
+    centroids: List[Dict[str, float]] = []
+    norms: List[float] = []
+    for i, vector in enumerate(vectors):
+        best, best_similarity = None, threshold
+        for c, centroid in enumerate(centroids):
+            if len(clusters[c]) >= max_size:
+                continue
+            similarity = _cosine(vector, centroid, norms[c])
+            if similarity >= best_similarity:
+                best, best_similarity = c, similarity
+        if best is None:
+            clusters.append([i])
+            centroids.append(dict(vector))
+            norms.append(math.sqrt(sum(v * v for v in vector.values())))
+            continue
+        clusters[best].append(i)
+        centroid = centroids[best]
+        for word, v in vector.items():
+            centroid[word] = centroid.get(word, 0.0) + v
+        norms[best] = math.sqrt(sum(v * v for v in centroid.values()))
+
+    topics = [c for c in clusters if len(c) >= min_size]
+    pooled = [i for c in clusters if len(c) < min_size for i in c]
+    topics += [pooled[i:i + max_size] for i in range(0, len(pooled), max_size)]
+    return topics
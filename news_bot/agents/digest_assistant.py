@@ -1,12 +1,48 @@
 import datetime
-from typing import Dict, Any, List
+import html
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
 
 import cache
 from sources.article import Article
-from .base import Assistant
+from .base import DEFAULT_BACKEND, Assistant
+from .clustering import cluster
+
+# "single" sends all articles in one request, "hierarchical" writes a partial digest per topic and merges them
+DIGEST_MODES = ("auto", "single", "hierarchical")
+# Articles from which "auto" switches to the hierarchical digest
+HIERARCHICAL_THRESHOLD = 60
+# Partial digests written or merged at the same time
+DIGEST_WORKERS = 32
+# Partial digests merged by one request, more are merged in several rounds
+MERGE_FAN_IN = 6
+# Share of changed or removed articles above which an incremental digest is written anew rather than updated
+INCREMENTAL_MAX_SHARE = 0.5
+
+UPDATE_INSTRUCTIONS = """Du aktualisierst einen bestehenden Überblick über die Nachrichten des Tages. Der User gibt dir den bisherigen Überblick als HTML, die seitdem neuen oder geänderten Artikel mit ihren Zusammenfassungen und die URLs entfernter Artikel.
+
+Deine Aufgabe ist es:
+1. Die neuen und geänderten Artikel in die passenden Themen einzuarbeiten oder neue Themen anzulegen, irrelevante News (z.b. Werbung, Wetter, Sport, Verkehrsinfos) zu ignorieren
+2. Inhalte und Links entfernter Artikel zu streichen
+3. Alles andere unverändert zu lassen, auch das HTML-Format (div class="story" mit story-title, story-summary und story-sources)
+
+Deine Ausgabe ist nur das HTML des ganzen aktualisierten Überblicks, ohne Einleitung, CSS oder JavaScript.
+"""
+
+MERGE_INSTRUCTIONS = """Du bekommst mehrere Teil-Überblicke über die Nachrichten des Tages als HTML, jeder zu einer Gruppe von Artikeln.
+
+Fasse sie zu einem einzigen Überblick zusammen:
+1. Lege Stories zum selben Thema zu einer zusammen, und ordne die Themen nach Wichtigkeit
+2. Übernimm nur Inhalte aus den Teil-Überblicken, lasse keine relevanten Stories aus
+3. Behalte alle Links auf die Quellen bei
+4. Behalte das HTML-Format der Teil-Überblicke genau bei (div class="story" mit story-title, story-summary und story-sources)
+
+Deine Ausgabe ist nur das HTML des Überblicks, ohne Einleitung, CSS oder JavaScript.
+"""
 
 class DigestAssistant(Assistant):
-    def __init__(self):
+    def __init__(self, backend: str = DEFAULT_BACKEND, mode: str = "auto", workers: int = DIGEST_WORKERS):
         super().__init__(
             name="News Digest",
             instructions="""Du erstellst einen sehr kurzen Überblick über die wichtigsten Nachrichten. Der User gibt dir eine Liste von Artikeln mit ihren Zusammenfassungen.
@@ -18,6 +54,7 @@ class DigestAssistant(Assistant):
             4. Die Userin ist Lokalpolitikerin und interessiert sich für alle relevanten Themen. Einer der Schwerpunkte ist Umweltschutz. 
             5. Jeder Absatz sollte mit HTML-Links auf die Quellen enden, also die verwendeten Artikel. Beispiel: ..text...text...text (<a href="http:/...">Merkur</a>)
             6. Strukturiere den Text mit HTML-Tags für Absätze, hebe wichtige stellen mit <b> hervor.
+            7. Steht bei einem Artikel "Weitere Quellen", haben diese Quellen dieselbe Geschichte gebracht. Verlinke sie ebenfalls.
 
 
             Deine Ausgabe sollte einfachs HTML sein (nur content, der später in ein Template eingefügt wird, kein CSS oder JavaScript). Sie sollte nur den Text und Links enthalten.
@@ -36,37 +73,135 @@ class DigestAssistant(Assistant):
               ...
             </div>
             ...
-            """
+            """,
+            backend=backend,
         )
+        if mode not in DIGEST_MODES:
+            raise ValueError(f"Unknown digest mode: {mode}")
+        self.mode = mode
+        self.workers = workers
         
-    def create_digest(self, articles: List[Article]) -> str:
+    def create_digest(self, articles: List[Article], incremental: bool = False,
+                      day: Optional[datetime.date] = None) -> str:
+        """Write the digest of the articles, or take it from the cache if they did not change.
+
+        With incremental, only the articles added or changed since the last
+        digest of the day, today unless given, are sent, together with that
+        digest to update.
+        """
         print (f"Creating digest for {len(articles)} articles (This might take a little while)")
 
-        cache_key = "digest:" + datetime.datetime.now().strftime("%Y%m%d") + "_" + str(len(articles))
-        if cache.has(cache_key):
-            return cache.get(cache_key)
+        articles_text = _articles_text(articles)
+        cache_key = "digest:" + cache.hash_string(articles_text)
+        latest_key = "digest:latest:" + (day or datetime.date.today()).strftime("%Y%m%d")
+        fingerprints = {article.source_url: cache.hash_string(_article_text(article)) for article in articles}
+        digest = cache.get(cache_key)
+        if digest is None:
+            digest = self._update(articles, fingerprints, cache.get(latest_key)) if incremental else None
+            if digest is None:
+                digest = self._write(articles, articles_text)
+            cache.put(cache_key, digest)
+        cache.put(latest_key, json.dumps({"digest": digest, "articles": fingerprints}))
+        return digest
 
-        articles_text = "\n\n".join([
-            f"Quelle: {article.source_name}\nURL: {article.source_url}\nTitel: {article.title}\nInhalt: {article.summary}"
-            for article in articles
-        ])
-        
-        thread = self.client.beta.threads.create()
-        self.client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=articles_text
-        )
-        
-        run = self.client.beta.threads.runs.create(
-            thread_id=thread.id,
-            assistant_id=self.assistant.id
-        )
-        
-        run_result = self._wait_for_run(thread.id, run.id)
-        if run_result["status"] != "completed":
-            raise Exception(f"Fehler beim Erstellen des Überblicks: {run_result.get('error', 'Unbekannter Fehler')}")
-        
-        digest = self._get_assistant_response(thread.id)
+    def _update(self, articles: List[Article], fingerprints: Dict[str, str], latest: Optional[str]) -> Optional[str]:
+        """Update the previous digest with the changed articles, None if it has to be written anew."""
+        if not latest:
+            return None
+        previous = json.loads(latest)
+        changed = [article for article in articles
+                   if previous["articles"].get(article.source_url) != fingerprints[article.source_url]]
+        removed = sorted(set(previous["articles"]) - set(fingerprints))
+        if not changed and not removed:
+            return previous["digest"]
+        if len(changed) + len(removed) > max(len(articles), len(previous["articles"])) * INCREMENTAL_MAX_SHARE:
+            return None
+
+        print(f"Updating the digest with {len(changed)} new or changed and {len(removed)} removed articles")
+        content = f"Bisheriger Überblick:\n{previous['digest']}\n\nNeue oder geänderte Artikel:\n\n{_articles_text(changed)}"
+        if removed:
+            content += "\n\nEntfernte Artikel:\n" + "\n".join(removed)
+        try:
+            return self.complete(content, UPDATE_INSTRUCTIONS)
+        except Exception as e:
+            print(f"Updating the digest failed, writing it anew: {str(e)}")
+            return None
+
+    def _write(self, articles: List[Article], articles_text: str) -> str:
+        if self.mode == "hierarchical" or (self.mode == "auto" and len(articles) > HIERARCHICAL_THRESHOLD):
+            return self._map_reduce(articles)
+        try:
+            return self.complete(articles_text)
+        except Exception as e:
+            raise Exception(f"Fehler beim Erstellen des Überblicks: {str(e)}")
+
+    def _map_reduce(self, articles: List[Article]) -> str:
+        """Write a partial digest per topic cluster in parallel, then merge them in rounds of MERGE_FAN_IN."""
+        groups = cluster([f"{article.title or ''}\n{article.summary or ''}" for article in articles])
+        print(f"Writing the digest in {len(groups)} topic groups")
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as pool:
+            parts = list(pool.map(self._partial_digest, [[articles[i] for i in group] for group in groups]))
+            while len(parts) > 1:
+                parts = list(pool.map(self._merge, [parts[i:i + MERGE_FAN_IN] for i in range(0, len(parts), MERGE_FAN_IN)]))
+        return parts[0] if parts else ""
+
+    def _partial_digest(self, articles: List[Article]) -> str:
+        """Digest of one topic group, or a plain list of its articles if the model fails."""
+        articles_text = _articles_text(articles)
+        cache_key = "partial:" + cache.hash_string(articles_text)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+        try:
+            digest = self.complete(articles_text)
+        except Exception as e:
+            print(f"Partial digest of {len(articles)} articles failed, listing them instead: {str(e)}")
+            return _article_list(articles)
         cache.put(cache_key, digest)
-        return digest
\ No newline at end of file
+        return digest
+
+    def _merge(self, parts: List[str]) -> str:
+        if len(parts) == 1:
+            return parts[0]
+        content = "\n\n".join(parts)
+        cache_key = "partial:" + cache.hash_string(MERGE_INSTRUCTIONS + content)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+        try:
+            digest = self.complete(content, MERGE_INSTRUCTIONS)
+        except Exception as e:
+            print(f"Merging {len(parts)} partial digests failed, keeping them side by side: {str(e)}")
+            return content
+        cache.put(cache_key, digest)
+        return digest
+
+
+def _article_text(article: Article) -> str:
+    text = f"Quelle: {article.source_name}\nURL: {article.source_url}\nTitel: {article.title}\nInhalt: {article.summary}"
+    if article.related:
+        text += "\nWeitere Quellen: " + ", ".join(f"{related.source_name} {related.source_url}" for related in article.related)
+    return text
+
+
+def _articles_text(articles: List[Article]) -> str:
+    return "\n\n".join(_article_text(article) for article in articles)
+
+
+def _article_list(articles: List[Article]) -> str:
+    """Stories of the digest format listing the articles by title, for groups the model could not summarize."""
+    return "\n".join(
+        f'<div class="story">\n'
+        f'    <h3 class="story-title">{html.escape(article.title or article.source_name)}</h3>\n'
+        f'    <div class="story-summary">{html.escape(article.summary or "")}</div>\n'
+        f'    <div class="story-sources">{_source_links([article] + article.related)}</div>\n'
+        f'</div>'
+        for article in articles
+    )
+
+
+def _source_links(articles: List[Article]) -> str:
+    return " ".join(
+        f'<a class="story-source" href="{html.escape(article.source_url or "")}">{html.escape(article.source_name)}</a>'
+        for article in articles
+    )
@@ -1,64 +1,169 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterator, List, Tuple
 
 from sources.article import Article
-from .base import Assistant
+from sources.extractor import estimate_tokens
+from .base import DEFAULT_BACKEND, Assistant
 import cache
 import json
+import threading
+from contextlib import ExitStack, contextmanager
+
+# Articles up to this length are summarized together with others by analyze_packed()
+PACK_MAX_CHARS = 2000
+# Articles summarized with one request by analyze_packed()
+PACK_SIZE = 8
+
+PACKED_INSTRUCTIONS = """
+Du bekommst mehrere kurze Artikel deutscher Regionalzeitungen, jeder beginnt mit einer Zeile "### Artikel <Nummer>".
+Fasse jeden Artikel für sich kurz und prägnant zusammen – ohne Einleitung, Überschrift oder Kommentar.
+Antworte ausschließlich mit einem JSON-Objekt, das die Nummer jedes Artikels auf seine Zusammenfassung abbildet, z.B. {"1": "...", "2": "..."}.
+"""
 
 class NewsAssistant(Assistant):
-    def __init__(self):
+    def __init__(self, backend: str = DEFAULT_BACKEND):
         super().__init__(
             name="News Analyst",
             instructions="""
-            Du bekommst bereinigte HTML-Snippets deutscher Regionalzeitungen. 
-            Extrahiere den Artikeltext und gib ausschließlich eine kurze, prägnante Zusammenfassung aus – ohne Einleitung, Überschrift oder Kommentar.
-            """
+            Du bekommst den Text von Artikeln deutscher Regionalzeitungen, manchmal auch bereinigte HTML-Snippets. 
+            Extrahiere gegebenenfalls den Artikeltext und gib ausschließlich eine kurze, prägnante Zusammenfassung aus – ohne Einleitung, Überschrift oder Kommentar.
+            """,
+            backend=backend,
         )
+        # Lock and number of workers holding or waiting for it, per summary cache key
+        self._locks: Dict[str, List] = {}
+        self._locks_lock = threading.Lock()
+        # Estimated input tokens per source, for the cleaned pages and for what is actually sent
+        self._input_tokens: Dict[str, Dict[str, int]] = {}
 
     def analyze_article(self, article: Article):
-        cache_key = "analyzed:" + article.source_url
+        content, cache_key = self.prepare(article)
+
+        with self._lock_for(cache_key):
+            if self.use_cached(article, cache_key):
+                return
+
+            print(f"Summary generation: {article.source_url}")
+            try:
+                result = self.complete(content)
+            except Exception as e:
+                article.error = f"assistant failed: {str(e)}"
+                return
+            self.store(article, cache_key, result)
+
+    def can_pack(self, article: Article) -> bool:
+        return len(article.content()) <= PACK_MAX_CHARS
+
+    def analyze_packed(self, articles: List[Article]) -> None:
+        """Summarize several short articles with one request, with the results of analyze_article().
+
+        Articles missing from the answer are summarized one by one.
+        """
+        prepared: Dict[str, Tuple[str, List[Article]]] = {}
+        for article in articles:
+            content, cache_key = self.prepare(article)
+            prepared.setdefault(cache_key, (content, []))[1].append(article)
+
+        with ExitStack() as stack:
+            # Sorted, so two packs sharing articles cannot deadlock
+            for cache_key in sorted(prepared):
+                stack.enter_context(self._lock_for(cache_key))
+            todo = []
+            for cache_key, (content, group) in prepared.items():
+                if self.use_cached(group[0], cache_key):
+                    for article in group[1:]:
+                        self.use_cached(article, cache_key)
+                else:
+                    todo.append(cache_key)
+            if not todo:
+                return
 
-        if cache.has(cache_key) and cache.has(article.cache_key_title()):
-            print(f"Summary cache: {article.source_url}")
-            article.summary = cache.get(cache_key)
-            article.date = cache.created(article.cache_key_raw())
-            article.title = cache.get(article.cache_key_title())
-            return
+            print(f"Summary generation for {len(todo)} packed articles: {prepared[todo[0]][1][0].source_url}, ...")
+            packed = "\n\n".join(f"### Artikel {i}\n{prepared[key][0]}" for i, key in enumerate(todo, 1))
+            try:
+                summaries = _split_packed(self.complete(packed, PACKED_INSTRUCTIONS))
+            except Exception as e:
+                print(f"Packed summary failed, summarizing one by one: {str(e)}")
+                summaries = {}
 
-        print(f"Summary generation: {article.source_url}")
-        thread = self.client.beta.threads.create()
+            for i, cache_key in enumerate(todo, 1):
+                content, group = prepared[cache_key]
+                summary = summaries.get(i)
+                if not summary:
+                    try:
+                        summary = self.complete(content)
+                    except Exception as e:
+                        for article in group:
+                            article.error = f"assistant failed: {str(e)}"
+                        continue
+                for article in group:
+                    self.store(article, cache_key, summary)
 
+    def prepare(self, article: Article) -> Tuple[str, str]:
+        """Get the content to summarize and the cache key of its summary."""
         max_len = 50000
-        cleaned_text = article.cleaned()
-        if len(cleaned_text) > max_len:
-            print(f"WARNING: Very long article with {len(cleaned_text)} chars: {article.source_url}")
-
-        self.client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=cleaned_text[:max_len],
-        )
+        text = article.content()
+        if len(text) > max_len:
+            print(f"WARNING: Very long article with {len(text)} chars: {article.source_url}")
+        content = text[:max_len]
+        self._count_input(article.source_name, article.cleaned()[:max_len], content)
+        article.title = article.title or cache.get(article.cache_key_title())
 
-        run = self.client.beta.threads.runs.create(
-            thread_id=thread.id,
-            assistant_id=self.assistant.id,
-        )
+        # Keyed by content, so identical articles are summarized once and edited ones again
+        return content, "analyzed:" + cache.hash_string(content)
+
+    def use_cached(self, article: Article, cache_key: str) -> bool:
+        """Take the summary from the cache if there is one."""
+        summary = cache.get(cache_key)
+        if summary is None:
+            return False
+        print(f"Summary cache: {article.source_url}")
+        article.summary = summary
+        article.date = cache.created(article.cache_key_raw())
+        return True
+
+    def store(self, article: Article, cache_key: str, summary: str) -> None:
+        cache.put(cache_key, summary)
+        article.summary = summary
 
+    def _count_input(self, source: str, cleaned: str, content: str) -> None:
+        with self._locks_lock:
+            counts = self._input_tokens.setdefault(source, {"articles": 0, "cleaned": 0, "sent": 0})
+            counts["articles"] += 1
+            counts["cleaned"] += estimate_tokens(cleaned)
+            counts["sent"] += estimate_tokens(content)
+
+    def input_stats(self) -> Dict[str, Dict[str, int]]:
+        """Estimated input tokens per source, of the cleaned pages and of the extracted text sent instead."""
+        with self._locks_lock:
+            return {source: dict(counts) for source, counts in self._input_tokens.items()}
+
+    @contextmanager
+    def _lock_for(self, cache_key: str) -> Iterator[None]:
+        """Hold the lock serializing summaries of the same content across workers.
+
+        The lock is dropped when no worker holds or waits for it anymore, later
+        requests for the content find its summary in the cache.
+        """
+        with self._locks_lock:
+            entry = self._locks.setdefault(cache_key, [threading.Lock(), 0])
+            entry[1] += 1
         try:
-            run_result = self._wait_for_run(thread.id, run.id)
-            if run_result["status"] != "completed":
-                article.error = "assistant failed: " +  run_result.get("error", "Unknown error")
-                return
+            with entry[0]:
+                yield
+        finally:
+            with self._locks_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[cache_key]
+
 
-            # Get and parse the response
-            result = self._get_assistant_response(thread.id)
-            cache.put(cache_key, result)
-
-            article.summary = result
-            return
-        except Exception as e:
-            print("\nGPT Response:")
-            print("-------------")
-            print(self._get_assistant_response(thread.id))
-            print("-------------")
-            article.error = f"Failed to parse response: {str(e)}"
+def _split_packed(answer: str) -> Dict[int, str]:
+    """Summaries by article number from the JSON answer to a packed request."""
+    answer = answer.strip()
+    if answer.startswith("```"):
+        answer = answer.split("\n", 1)[-1].rsplit("```", 1)[0]
+    data = json.loads(answer)
+    return {
+        int(number): summary.strip() for number, summary in data.items()
+        if str(number).isdigit() and isinstance(summary, str) and summary.strip()
+    }
@@ -0,0 +1,80 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+REGISTRY_PATH = Path.home() / ".news-bot" / "assistants.json"
+
+
+def instructions_hash(instructions: str) -> str:
+    return hashlib.sha256(instructions.encode('utf-8')).hexdigest()[:16]
+
+
+class AssistantRegistry:
+    """Persistent IDs of the assistants created on the server, by name, model and instructions.
+
+    An assistant is reused as long as its instructions stay the same, and
+    replaced by a new one once they change.
+    """
+
+    def __init__(self, path: Path = REGISTRY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, Dict[str, str]]:
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error reading assistant registry {self.path}: {e}")
+            return {}
+
+    def _save(self, entries: Dict[str, Dict[str, str]]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def get_or_create(self, name: str, model: str, instructions: str, create: Callable[[], str],
+                      delete: Optional[Callable[[str], None]] = None) -> str:
+        """Get the ID of the matching assistant, calling create() for a new one if there is none.
+
+        An assistant of the same name and model with other instructions is
+        replaced, and removed from the server with delete() if given.
+        """
+        key = f"{name}:{model}"
+        digest = instructions_hash(instructions)
+        with self._lock:
+            entries = self._load()
+            entry = entries.get(key)
+            if entry and entry['instructions'] == digest:
+                return entry['id']
+
+            assistant_id = create()
+            entries[key] = {'id': assistant_id, 'instructions': digest}
+            self._save(entries)
+        if entry and delete:
+            try:
+                delete(entry['id'])
+            except Exception as e:
+                print(f"Could not delete outdated assistant {entry['id']}: {str(e)}")
+        return assistant_id
+
+    def forget(self, name: str, model: str) -> None:
+        """Drop the entry of an assistant that no longer exists on the server."""
+        with self._lock:
+            entries = self._load()
+            if entries.pop(f"{name}:{model}", None) is not None:
+                self._save(entries)
+
+
+_registry = AssistantRegistry()
+
+
+def get_registry() -> AssistantRegistry:
+    return _registry
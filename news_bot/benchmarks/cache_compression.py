@@ -0,0 +1,76 @@
+"""Measure the disk savings and read/write latency of compressed cache entries.
+
+Copies entries of the real cache into temporary SQLite stores, once plain and
+once per compression level, and compares file size and per-entry latency:
+
+    news-bot --module benchmarks.cache_compression --limit 500
+"""
+import argparse
+import itertools
+import tempfile
+import time
+import zlib
+from pathlib import Path
+from typing import List, Optional
+
+import cache
+
+
+def measure(entries: List[bytes], level: Optional[int], directory: Path) -> dict:
+    """Write and read the entries through a fresh SQLite backend."""
+    path = directory / f"bench-{level}.sqlite3"
+    backend = cache.SQLiteBackend(path)
+
+    start = time.perf_counter()
+    for i, data in enumerate(entries):
+        if level is not None:
+            data = cache.ZLIB_MARKER + zlib.compress(data, level)
+        backend.store_many([(str(i), "bench", data, 0.0)])
+    write = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(len(entries)):
+        cache.decode(backend.load(str(i))[0])
+    read = time.perf_counter() - start
+
+    backend._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    backend._conn.close()
+    return {
+        "size": path.stat().st_size,
+        "write_ms": write * 1000 / max(1, len(entries)),
+        "read_ms": read * 1000 / max(1, len(entries)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark cache compression on the real cache')
+    parser.add_argument('--namespaces', nargs='+', default=sorted(cache.COMPRESSED_NAMESPACES),
+                        help='Namespaces to sample')
+    parser.add_argument('--limit', type=int, default=500, help='Entries sampled per namespace')
+    parser.add_argument('--levels', nargs='+', type=int, default=[1, cache.COMPRESSION_LEVEL, 9],
+                        help='zlib compression levels to compare')
+    args = parser.parse_args()
+
+    backend = cache.get_backend()
+    print(f"{'namespace':<10} {'mode':<8} {'entries':>8} {'disk MB':>9} {'saved':>7} {'write ms':>9} {'read ms':>8}")
+    for namespace in args.namespaces:
+        entries = [
+            cache.decode(data).encode('utf-8')
+            for _, _, _, data in itertools.islice(backend.items(namespace), args.limit)
+        ]
+        if not entries:
+            print(f"{namespace:<10} no entries")
+            continue
+
+        with tempfile.TemporaryDirectory() as directory:
+            plain = measure(entries, None, Path(directory))
+            rows = [("plain", plain)] + [(f"zlib-{level}", measure(entries, level, Path(directory))) for level in args.levels]
+
+        for mode, result in rows:
+            saved = 1 - result["size"] / plain["size"]
+            print(f"{namespace:<10} {mode:<8} {len(entries):>8} {result['size'] / 1e6:>9.2f} {saved:>7.0%} "
+                  f"{result['write_ms']:>9.3f} {result['read_ms']:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Compare the single-pass HTML cleaner with the former BeautifulSoup implementation.
+
+Checks the golden corpus in benchmarks/cleaner_golden, then cleans the raw pages
+of the cache, and any HTML files given, with both implementations and reports
+pages with differing output and the time taken:
+
+    news-bot --module benchmarks.cleaner --limit 200
+    news-bot --module benchmarks.cleaner --html saved-pages/*.html
+
+The expected outputs of the golden corpus are produced by the former
+implementation, --update-golden writes them again after adding a case.
+"""
+import argparse
+import itertools
+import json
+import time
+import warnings
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from bs4 import BeautifulSoup, NavigableString, XMLParsedAsHTMLWarning
+
+import cache
+from sources.cleaner import clean_html
+
+GOLDEN_DIR = Path(__file__).parent / "cleaner_golden"
+
+
+def legacy_clean_html(raw: str) -> Tuple[str, Optional[str]]:
+    """The multi-pass BeautifulSoup cleaner formerly in Article.cleaned()."""
+    soup = BeautifulSoup(raw, 'html.parser')
+
+    title = None
+    title_tag = soup.find('title')
+    if title_tag:
+        title = title_tag.get_text().strip()
+
+    for element in soup(['header','script', 'style', 'img','picture', 'source', 'head', 'polygon', 'button', 'iframe', 'svg']):
+        element.decompose()
+
+    for li in soup.find_all('li'):
+        for content in li.contents:
+            if isinstance(content, NavigableString) and content.strip() == '':
+                content.extract()
+        if len(li.contents) == 0 or (len(li.contents) == 1 and li.find('a')):
+            li.decompose()
+    for node in soup.find_all('ul'):
+        if len(node.contents) == 0:
+            node.decompose()
+    for node in soup.find_all('a'):
+        if len(node.contents) == 0:
+            node.decompose()
+
+    for node in soup.find_all(['span', 'em', 'i', 'b', 'li', 'ul', 'table', 'nav']):
+        node.unwrap()
+
+    for div in soup.find_all('div'):
+        if not div.find(['article', 'h1', 'h2', 'h3', 'p', 'strong']):
+            div.unwrap()
+
+    for tag in soup.find_all():
+        for attribute in list(tag.attrs):
+            del tag[attribute]
+    text = str(soup)
+    text = ' '.join(text.split())
+    soup = BeautifulSoup(text, 'html.parser')
+    return str(soup), title
+
+
+def check_golden(update: bool) -> int:
+    """Compare the cleaner with the expected outputs of the golden corpus, returning the failures."""
+    failures = 0
+    for path in sorted(GOLDEN_DIR.glob("*.html")):
+        raw = path.read_text(encoding='utf-8')
+        expected_path = path.with_suffix(".json")
+        if update:
+            cleaned, title = legacy_clean_html(raw)
+            expected_path.write_text(json.dumps({"cleaned": cleaned, "title": title}, ensure_ascii=False, indent=2) + "\n",
+                                     encoding='utf-8')
+        expected = json.loads(expected_path.read_text(encoding='utf-8'))
+        if clean_html(raw) != (expected["cleaned"], expected["title"]):
+            failures += 1
+            print(f"Golden case {path.name} differs")
+    return failures
+
+
+def load_pages(limit: int, files: List[str]) -> List[Tuple[str, str]]:
+    pages = [(name, Path(name).read_text(encoding='utf-8', errors='replace')) for name in files]
+    backend = cache.get_backend()
+    for entry_id, _, _, data in itertools.islice(backend.items("raw"), limit):
+        pages.append((entry_id, cache.decode(data)))
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the HTML cleaner against the former implementation')
+    parser.add_argument('--limit', type=int, default=200, help='Raw pages taken from the cache')
+    parser.add_argument('--html', nargs='*', default=[], help='Additional HTML files to clean')
+    parser.add_argument('--update-golden', action='store_true',
+                        help='Write the expected outputs of the golden corpus with the former implementation')
+    args = parser.parse_args()
+    warnings.filterwarnings('ignore', category=XMLParsedAsHTMLWarning)
+
+    failures = check_golden(args.update_golden)
+    print(f"Golden corpus: {failures} failures")
+
+    pages = load_pages(args.limit, args.html)
+    if not pages:
+        print("No pages to compare")
+        return
+
+    legacy_time = single_pass_time = 0.0
+    mismatches = 0
+    for name, raw in pages:
+        start = time.perf_counter()
+        expected = legacy_clean_html(raw)
+        legacy_time += time.perf_counter() - start
+        start = time.perf_counter()
+        result = clean_html(raw)
+        single_pass_time += time.perf_counter() - start
+        if result != expected:
+            mismatches += 1
+            print(f"Output differs for {name}")
+
+    size = sum(len(raw) for _, raw in pages) / 1e6
+    print(f"{len(pages)} pages ({size:.1f} MB), {mismatches} with differing output")
+    print(f"{'cleaner':<14} {'total s':>8} {'ms/page':>8} {'MB/s':>7}")
+    for label, seconds in (("beautifulsoup", legacy_time), ("single-pass", single_pass_time)):
+        print(f"{label:<14} {seconds:>8.2f} {seconds * 1000 / len(pages):>8.2f} {size / max(seconds, 1e-9):>7.2f}")
+    print(f"Speedup: {legacy_time / max(single_pass_time, 1e-9):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Compare the latency of single-request and hierarchical digests as the number of articles grows.
+
+Writes digests of synthetic articles on a handful of topics with one request
+and with the map-reduce of the DigestAssistant, against benchmarks.fake_openai with a latency growing
+with the input. The results go to a temporary cache:
+
+    news-bot --module benchmarks.digest --articles 50 100 200 400
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import List
+
+import cache
+from agents.base import Assistant
+from agents.clustering import cluster
+from benchmarks.fake_openai import FakeOpenAI
+from sources.article import Article
+
+TOPICS = [
+    ("Gemeinderat", "Der Gemeinderat hat den Haushalt und neue Kita-Plätze beschlossen, die Opposition kritisiert die Schulden"),
+    ("Polizei", "Die Polizei meldet einen Einbruch und sucht Zeugen, der Täter flüchtete mit einem Fahrrad"),
+    ("Umwelt", "Der Naturschutzbund warnt vor dem Ausbau der Straße durch das Moor, Anwohner sammeln Unterschriften"),
+    ("Verkehr", "Wegen Bauarbeiten an der Brücke wird die Bundesstraße wochenlang gesperrt, Pendler müssen Umleitungen fahren"),
+    ("Kultur", "Das Stadttheater eröffnet die Saison mit einer Premiere, das Ensemble probte monatelang"),
+    ("Schule", "Das Gymnasium bekommt eine neue Turnhalle, der Landkreis übernimmt einen Großteil der Kosten"),
+]
+
+
+def make_articles(count: int, rng: random.Random) -> List[Article]:
+    run = uuid.uuid4().hex
+    articles = []
+    for i in range(count):
+        topic, summary = rng.choice(TOPICS)
+        articles.append(Article(source_name="bench", source_url=f"https://bench.example/{run}/{i}",
+                                title=f"{topic}: Meldung {i}", summary=f"{summary}. Ort {rng.randint(1, 30)}."))
+    return articles
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark single-request and hierarchical digests')
+    parser.add_argument('--articles', type=int, nargs='*', default=[50, 100, 200, 400])
+    parser.add_argument('--latency', type=float, default=1.0, help='Seconds the fake API takes per answer')
+    parser.add_argument('--latency-per-1k-tokens', type=float, default=1.0,
+                        help='Additional seconds the fake API takes per 1000 input tokens')
+    args = parser.parse_args()
+
+    cache._backend = cache.SQLiteBackend(Path(tempfile.mkdtemp(prefix="news-bot-bench-")) / "cache.sqlite3")
+    Assistant._api_key = "fake"
+    server = FakeOpenAI(latency=args.latency, rpm=100000, tpm=100000000,
+                        latency_per_1k_tokens=args.latency_per_1k_tokens).start()
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    # Imported late, the clients read the base URL from the environment
+    from agents.digest_assistant import DigestAssistant, _articles_text
+    digest_assistant = DigestAssistant()
+    rng = random.Random(0)
+
+    print(f"{'articles':>8} {'groups':>6} {'single s':>9} {'hierarchical s':>15} {'requests':>9}")
+    for count in args.articles:
+        articles = make_articles(count, rng)
+        groups = len(cluster([f"{a.title}\n{a.summary}" for a in articles]))
+        start = time.perf_counter()
+        digest_assistant.complete(_articles_text(articles))
+        single = time.perf_counter() - start
+        server.requests = 0
+        start = time.perf_counter()
+        digest_assistant._map_reduce(articles)
+        hierarchical = time.perf_counter() - start
+        print(f"{count:>8} {groups:>6} {single:>9.2f} {hierarchical:>15.2f} {server.requests:>9}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Local stand-in for the chat completions endpoint of the OpenAI API.
+
+Answers after a fixed latency, plus a latency per 1000 tokens of input if
+given, and enforces request and token limits per
+window like the real API, answering 429 with Retry-After when they are
+exceeded. Point the clients at it with OPENAI_BASE_URL:
+
+    news-bot --module benchmarks.fake_openai --port 8099 --rpm 500
+    OPENAI_BASE_URL=http://127.0.0.1:8099/v1 news-bot --async-summaries
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Deque, Optional, Tuple
+
+CHARS_PER_TOKEN = 4
+PACKED_ARTICLE_PATTERN = re.compile(r'^### Artikel (\d+)$', re.MULTILINE)
+
+
+class FakeOpenAI(ThreadingHTTPServer):
+    daemon_threads = True
+    # Connections of many concurrent clients must not be refused
+    request_queue_size = 1024
+
+    def __init__(self, port: int = 0, latency: float = 0.5, rpm: int = 500, tpm: int = 200000, window: float = 60.0,
+                 latency_per_1k_tokens: float = 0.0):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.latency = latency
+        self.latency_per_1k_tokens = latency_per_1k_tokens
+        self.rpm = rpm
+        self.tpm = tpm
+        self.window = window
+        self.requests = 0
+        self.rejected = 0
+        self._recent: Deque[Tuple[float, int]] = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def admit(self, tokens: int) -> Optional[float]:
+        """Count a request against the limits, returning the seconds to wait if it is over them."""
+        with self._lock:
+            now = time.monotonic()
+            while self._recent and self._recent[0][0] <= now - self.window:
+                self._recent.popleft()
+            used = sum(t for _, t in self._recent)
+            if len(self._recent) >= self.rpm or (self._recent and used + tokens > self.tpm):
+                self.rejected += 1
+                return self._recent[0][0] + self.window - now
+            self._recent.append((now, tokens))
+            self.requests += 1
+            return None
+
+    def start(self) -> "FakeOpenAI":
+        threading.Thread(target=self.serve_forever, name="fake-openai", daemon=True).start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakeOpenAI
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+
+        tokens = sum(len(m.get("content") or "") for m in body.get("messages", [])) // CHARS_PER_TOKEN
+        wait = self.server.admit(tokens)
+        if wait is not None:
+            self._json(429, {"error": {"message": "Rate limit reached", "type": "requests",
+                                       "code": "rate_limit_exceeded"}},
+                       {"retry-after": f"{max(wait, 0.01):.2f}"})
+            return
+
+        latency = self.server.latency + self.server.latency_per_1k_tokens * tokens / 1000
+        time.sleep(latency * random.uniform(0.8, 1.2))
+        text = f"Zusammenfassung von {tokens} Tokens."
+        # Several articles packed into one request are answered with a summary per number
+        numbers = PACKED_ARTICLE_PATTERN.findall(body.get("messages", [{}])[-1].get("content") or "")
+        if numbers:
+            text = json.dumps({number: f"Zusammenfassung von Artikel {number}." for number in numbers})
+        completion = {"id": "chatcmpl-fake", "created": int(time.time()), "model": body.get("model", "fake")}
+        if body.get("stream"):
+            chunk = dict(completion, object="chat.completion.chunk",
+                         choices=[{"index": 0, "delta": {"role": "assistant", "content": text}, "finish_reason": "stop"}])
+            data = f"data: {json.dumps(chunk)}\n\ndata: [DONE]\n\n".encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        self._json(200, dict(completion, object="chat.completion", choices=[
+            {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            usage={"prompt_tokens": tokens, "completion_tokens": 10, "total_tokens": tokens + 10}))
+
+    def _json(self, status: int, payload: dict, headers: Optional[dict] = None) -> None:
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a fake OpenAI chat completions endpoint')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.5, help='Seconds per answer')
+    parser.add_argument('--latency-per-1k-tokens', type=float, default=0.0, help='Additional seconds per 1000 input tokens')
+    parser.add_argument('--rpm', type=int, default=500, help='Requests allowed per window')
+    parser.add_argument('--tpm', type=int, default=200000, help='Tokens allowed per window')
+    parser.add_argument('--window', type=float, default=60.0, help='Seconds of the limit window')
+    args = parser.parse_args()
+
+    server = FakeOpenAI(args.port, args.latency, args.rpm, args.tpm, args.window, args.latency_per_1k_tokens)
+    print(f"Serving fake OpenAI API at {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Compare the throughput of threaded, packed and async summaries against a fake OpenAI endpoint.
+
+Summarizes synthetic articles with NewsAssistant.analyze_article on a thread
+pool, PACK_SIZE at a time with NewsAssistant.analyze_packed and with the
+AsyncSummarizer, all talking to benchmarks.fake_openai.
+The summaries go to a temporary cache, so the real one stays untouched:
+
+    news-bot --module benchmarks.summarizer --articles 300 --latency 0.5
+    news-bot --module benchmarks.summarizer --server-rpm 100 --window 5 --rpm 120
+"""
+import argparse
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import List
+
+import cache
+from agents.base import Assistant
+from agents.async_summarizer import AsyncSummarizer, DEFAULT_CONCURRENCY
+from agents.news_assistant import PACK_SIZE
+from benchmarks.fake_openai import FakeOpenAI
+from sources.article import Article
+from pipeline import DEFAULT_WORKERS
+
+
+def make_articles(count: int, length: int) -> List[Article]:
+    # A new run id each time, so no summary comes from the cache
+    run = uuid.uuid4().hex
+    articles = []
+    for i in range(count):
+        text = f"Artikel {i} von {run}. " + "Der Gemeinderat hat über den Haushalt beraten, " * (length // 48)
+        articles.append(Article(source_name="bench", source_url=f"https://bench.example/{run}/{i}",
+                                title=f"Artikel {i}", text=text, cleaned_html=text))
+    return articles
+
+
+def report(label: str, articles: List[Article], seconds: float, server: FakeOpenAI) -> None:
+    failed = sum(1 for article in articles if article.error)
+    print(f"{label:<24} {seconds:>8.2f} {len(articles) / seconds:>10.1f} {server.requests:>9} {failed:>7} "
+          f"{server.rejected:>5}")
+    server.requests = server.rejected = 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark threaded, packed and async summaries against a fake OpenAI API')
+    parser.add_argument('--articles', type=int, default=200)
+    parser.add_argument('--length', type=int, default=1500, help='Characters per article')
+    parser.add_argument('--latency', type=float, default=0.5, help='Seconds the fake API takes per answer')
+    parser.add_argument('--server-rpm', type=int, default=10000, help='Requests the fake API allows per window')
+    parser.add_argument('--server-tpm', type=int, default=10000000, help='Tokens the fake API allows per window')
+    parser.add_argument('--window', type=float, default=60.0, help='Seconds of the limit window of the fake API')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Threads of the threaded run')
+    parser.add_argument('--concurrency', type=int, nargs='*', default=[DEFAULT_CONCURRENCY],
+                        help='Concurrency of the async runs')
+    parser.add_argument('--rpm', type=int, default=10000, help='Requests per minute the async summarizer allows itself')
+    parser.add_argument('--tpm', type=int, default=10000000, help='Tokens per minute the async summarizer allows itself')
+    args = parser.parse_args()
+
+    directory = Path(tempfile.mkdtemp(prefix="news-bot-bench-"))
+    cache._backend = cache.SQLiteBackend(directory / "cache.sqlite3")
+    Assistant._api_key = "fake"
+    server = FakeOpenAI(latency=args.latency, rpm=args.server_rpm, tpm=args.server_tpm, window=args.window).start()
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    # Imported late, the clients read the base URL from the environment
+    from agents.news_assistant import NewsAssistant
+    news_assistant = NewsAssistant()
+
+    print(f"{'run':<24} {'total s':>8} {'articles/s':>10} {'requests':>9} {'failed':>7} {'429s':>5}")
+    articles = make_articles(args.articles, args.length)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as threads:
+        wait([threads.submit(news_assistant.analyze_article, article) for article in articles])
+    report(f"threads ({args.workers})", articles, time.perf_counter() - start, server)
+
+    articles = make_articles(args.articles, args.length)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as threads:
+        wait([threads.submit(news_assistant.analyze_packed, articles[i:i + PACK_SIZE])
+              for i in range(0, len(articles), PACK_SIZE)])
+    report(f"packed ({args.workers})", articles, time.perf_counter() - start, server)
+
+    for concurrency in args.concurrency:
+        articles = make_articles(args.articles, args.length)
+        start = time.perf_counter()
+        with AsyncSummarizer(news_assistant, concurrency=concurrency, rpm=args.rpm, tpm=args.tpm) as summarizer:
+            wait([summarizer.submit(article) for article in articles])
+        report(f"async ({concurrency})", articles, time.perf_counter() - start, server)
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Compare link extraction and URL filtering with the former BeautifulSoup and linear-scan version.
+
+Runs both on the cached landing pages of all sources, on saved pages and on
+synthetic pages with thousands of links, checks that they select the same
+URLs and reports the time taken:
+
+    news-bot --module benchmarks.url_filter --synthetic 5000
+    news-bot --module benchmarks.url_filter --source merkur --html saved/merkur-*.html
+"""
+import argparse
+import random
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Set, Tuple
+from urllib.parse import urljoin, urlparse
+
+from bs4 import BeautifulSoup
+
+import cache
+from sources import NewsFetcherFactory
+from sources.fetcher import extract_links
+from sources.urls import UrlFilter, canonicalize_url
+
+
+def legacy_links(html: str) -> List[str]:
+    return [link['href'] for link in BeautifulSoup(html, 'html.parser').find_all('a', href=True)]
+
+
+def legacy_filter(config: Dict[str, Any]) -> Callable[[str], bool]:
+    """The substring scans formerly in BaseNewsFetcher._is_article_url, without the logging."""
+    def is_article_url(url: str) -> bool:
+        path = urlparse(url).path
+        for pattern in config['skip_patterns']:
+            if pattern in path:
+                return False
+        if not any(section in path for section in config['article_sections']):
+            return False
+
+        parts = path.strip("/").split("/")
+        validation = config['path_validation']
+        if len(parts) < validation['min_parts']:
+            return False
+        if 'required_parts' in validation:
+            for i, part in enumerate(validation['required_parts']):
+                if i >= len(parts) or parts[i] != part:
+                    return False
+        if 'exclude_parts' in validation:
+            if any(part in validation['exclude_parts'] for part in parts):
+                return False
+        if 'must_end_with' in validation:
+            if not parts[-1].endswith(validation['must_end_with']):
+                return False
+        return True
+    return is_article_url
+
+
+def select(base_url: str, links: List[str], is_valid_url: Callable[[str], bool]) -> Set[str]:
+    """The URL selection of extract_urls()."""
+    valid_urls = set()
+    seen = set()
+    for href in links:
+        if href.startswith('/'):
+            href = urljoin(base_url, href)
+        elif not href.startswith(('http://', 'https://')):
+            continue
+        href = canonicalize_url(href)
+        if href not in seen:
+            seen.add(href)
+            if is_valid_url(href):
+                valid_urls.add(href)
+    return valid_urls
+
+
+def synthetic_page(config: Dict[str, Any], links: int, rng: random.Random) -> str:
+    """A landing page mixing article links, excluded links and links to other sites."""
+    sections = config['article_sections']
+    skips = config['skip_patterns']
+    suffix = config['path_validation'].get('must_end_with') or ''
+    anchors = []
+    for i in range(links):
+        kind = rng.random()
+        if kind < 0.4:
+            href = f"{rng.choice(sections)}/ort-{i % 17}/artikel-{i}{suffix}"
+        elif kind < 0.7:
+            href = f"{rng.choice(skips)}/seite-{i}"
+        elif kind < 0.85:
+            href = f"https://example.com/extern/{i}?utm_source=news"
+        else:
+            href = f"/rubrik-{i % 40}/"
+        anchors.append(f'<li class="teaser"><a href="{href}" data-id="{i}"><span>Teaser {i}</span></a></li>')
+    return f"<html><body><ul>{''.join(anchors)}</ul></body></html>"
+
+
+def measure(html: str, base_url: str, extract: Callable[[str], List[str]], is_valid_url: Callable[[str], bool],
+            repeat: int) -> Tuple[Set[str], float, float]:
+    """Run extraction and filtering, returning the URLs and the seconds spent on each."""
+    parse_time = filter_time = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        links = extract(html)
+        parse_time += time.perf_counter() - start
+        start = time.perf_counter()
+        urls = select(base_url, links, is_valid_url)
+        filter_time += time.perf_counter() - start
+    return urls, parse_time / repeat, filter_time / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark link extraction and URL filtering of the sources')
+    parser.add_argument('--source', help='Source of the --html pages, and the only source benchmarked')
+    parser.add_argument('--html', nargs='*', default=[], help='Saved landing pages of --source')
+    parser.add_argument('--synthetic', type=int, default=5000, help='Links per synthetic page, 0 to skip them')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per page')
+    args = parser.parse_args()
+    if args.html and not args.source:
+        parser.error('--html needs --source')
+
+    factory = NewsFetcherFactory()
+    sources = [args.source] if args.source else factory.get_available_sources()
+    rng = random.Random(0)
+    pages = []
+    for source in sources:
+        config = factory.load_config(source)
+        cached = cache.get("index:" + config['source_url'])
+        if cached:
+            pages.append((source, "cached", cached))
+        pages.extend((source, Path(name).name, Path(name).read_text(encoding='utf-8', errors='replace'))
+                     for name in args.html)
+        if args.synthetic:
+            pages.append((source, f"synthetic-{args.synthetic}", synthetic_page(config, args.synthetic, rng)))
+
+    print(f"{'source':<14} {'page':<18} {'links':>6} {'urls':>5} {'bs4+scan ms':>12} {'parser+regex ms':>16} {'speedup':>8}")
+    for source, name, html in pages:
+        config = factory.load_config(source)
+        url_filter = UrlFilter(config['skip_patterns'], config['article_sections'], config['path_validation'])
+        before, old_parse, old_filter = measure(html, config['source_url'], legacy_links, legacy_filter(config), args.repeat)
+        after, new_parse, new_filter = measure(html, config['source_url'], extract_links, url_filter, args.repeat)
+        if before != after:
+            print(f"{source}/{name}: selected URLs differ, {len(before ^ after)} URLs only in one result")
+        old, new = old_parse + old_filter, new_parse + new_filter
+        print(f"{source:<14} {name:<18} {len(extract_links(html)):>6} {len(after):>5} {old * 1000:>12.1f} "
+              f"{new * 1000:>16.1f} {old / max(new, 1e-9):>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,479 @@
+import argparse
 import datetime
 import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
 from datetime import date
 from pathlib import Path
 import json
-from typing import Optional, Any
+from typing import Optional, Any, Dict, List, Iterable, Tuple
 
 CACHE_DIR = Path.home() / ".news-bot" / "cache"
 CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
+# "sqlite" keeps all entries in one indexed database file, "files" stores one file per entry
+CACHE_BACKEND = os.environ.get("NEWS_BOT_CACHE_BACKEND", "sqlite")
+SQLITE_PATH = CACHE_DIR / "cache.sqlite3"
+# Size of the in-memory LRU tier in front of the backend
+MEMORY_CACHE_BYTES = int(os.environ.get("NEWS_BOT_CACHE_MEMORY_BYTES", 64 * 1024 * 1024))
+# Creation times remembered by the in-memory tier, the least recently used are forgotten beyond this
+MEMORY_CACHE_ENTRIES = 100000
+
+# Namespaces whose entries are stored zlib-compressed
+COMPRESSED_NAMESPACES = {"raw", "cleaned", "index"}
+COMPRESSION_LEVEL = 6
+# Prefix of compressed entries. Plain entries are UTF-8 text and never start with a NUL byte.
+ZLIB_MARKER = b"\x00zlib\x00"
+
+DAY = 24 * 60 * 60
+# Seconds entries of a namespace are kept by gc(), None keeps them forever
+TTLS = {
+    "raw": 7 * DAY,
+    "cleaned": 7 * DAY,
+    "title": 7 * DAY,
+    "text": 7 * DAY,
+    "index": 7 * DAY,
+    "meta": 7 * DAY,
+    "analyzed": 90 * DAY,
+    "digest": 30 * DAY,
+    "partial": 7 * DAY,
+    # When an article was first discovered, Article.is_from_today() relies on it after its pages expired.
+    # Kept well beyond the 30 days of the seen index, section pages rarely link articles that long.
+    "firstseen": 90 * DAY,
+}
+# TTL of namespaces not listed in TTLS
+DEFAULT_TTL = None
+
+# File names of the one-file-per-entry layout: <namespace>_<sha256 of key>
+LEGACY_FILE_PATTERN = re.compile(r"^([^_]+)_([0-9a-f]{64})$")
+
+class FileBackend:
+    """Stores every entry as its own file, named by the entry id."""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+
+    def load(self, entry_id: str) -> Optional[Tuple[bytes, float]]:
+        path = self.directory / entry_id
+        try:
+            with open(path, 'rb') as f:
+                return f.read(), os.fstat(f.fileno()).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def load_many(self, entry_ids: List[str]) -> Dict[str, Tuple[bytes, float]]:
+        entries = {}
+        for entry_id in entry_ids:
+            entry = self.load(entry_id)
+            if entry is not None:
+                entries[entry_id] = entry
+        return entries
+
+    def stat(self, entry_id: str) -> Optional[float]:
+        try:
+            return (self.directory / entry_id).stat().st_mtime
+        except FileNotFoundError:
+            return None
+
+    def store_many(self, entries: List[Tuple[str, str, bytes, float]]) -> None:
+        for entry_id, namespace, data, created in entries:
+            path = self.directory / entry_id
+            with open(path, 'wb') as f:
+                f.write(data)
+            os.utime(path, (created, created))
+
+    def remove(self, entry_id: str) -> None:
+        try:
+            (self.directory / entry_id).unlink()
+        except FileNotFoundError:
+            pass
+
+    def entries(self) -> Iterable[Tuple[str, str, float, int]]:
+        """Iterate over (id, namespace, created, size) of all entries without reading them."""
+        for entry in os.scandir(self.directory):
+            match = LEGACY_FILE_PATTERN.match(entry.name)
+            if match:
+                stat = entry.stat()
+                yield entry.name, match.group(1), stat.st_mtime, stat.st_size
+
+    def remove_many(self, entry_ids: List[str]) -> None:
+        for entry_id in entry_ids:
+            self.remove(entry_id)
+
+    def compact(self) -> None:
+        pass
+
+    def items(self, namespace: Optional[str] = None) -> Iterable[Tuple[str, str, float, bytes]]:
+        """Iterate over (id, namespace, created, data) of all entries, or those of one namespace."""
+        prefix = namespace + "_" if namespace else ""
+        for entry in os.scandir(self.directory):
+            match = LEGACY_FILE_PATTERN.match(entry.name)
+            if not match or not entry.name.startswith(prefix):
+                continue
+            loaded = self.load(entry.name)
+            if loaded is not None:
+                yield entry.name, match.group(1), loaded[1], loaded[0]
+
+class SQLiteBackend:
+    """Stores all entries in one SQLite database, indexed by namespace and creation time."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " id TEXT PRIMARY KEY,"
+            " namespace TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " value BLOB NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_namespace_created ON entries (namespace, created)")
+        self._conn.commit()
+
+    def load(self, entry_id: str) -> Optional[Tuple[bytes, float]]:
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM entries WHERE id = ?", (entry_id,)).fetchone()
+        return (bytes(row[0]), row[1]) if row else None
+
+    def load_many(self, entry_ids: List[str]) -> Dict[str, Tuple[bytes, float]]:
+        entries = {}
+        # Stay below SQLite's limit of host parameters per statement
+        for start in range(0, len(entry_ids), 500):
+            chunk = entry_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT id, value, created FROM entries WHERE id IN ({placeholders})", chunk
+                ).fetchall()
+            for entry_id, value, created in rows:
+                entries[entry_id] = (bytes(value), created)
+        return entries
+
+    def stat(self, entry_id: str) -> Optional[float]:
+        with self._lock:
+            row = self._conn.execute("SELECT created FROM entries WHERE id = ?", (entry_id,)).fetchone()
+        return row[0] if row else None
+
+    def store_many(self, entries: List[Tuple[str, str, bytes, float]]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (id, namespace, created, size, value) VALUES (?, ?, ?, ?, ?)",
+                [(entry_id, namespace, created, len(data), data) for entry_id, namespace, data, created in entries]
+            )
+            self._conn.commit()
+
+    def remove(self, entry_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE id = ?", (entry_id,))
+            self._conn.commit()
+
+    def entries(self) -> Iterable[Tuple[str, str, float, int]]:
+        """Iterate over (id, namespace, created, size) of all entries without reading them."""
+        with self._lock:
+            return self._conn.execute("SELECT id, namespace, created, size FROM entries").fetchall()
+
+    def remove_many(self, entry_ids: List[str]) -> None:
+        with self._lock:
+            self._conn.executemany("DELETE FROM entries WHERE id = ?", [(entry_id,) for entry_id in entry_ids])
+            self._conn.commit()
+
+    def compact(self) -> None:
+        """Give the space of deleted entries back to the file system."""
+        with self._lock:
+            self._conn.execute("VACUUM")
+
+    def items(self, namespace: Optional[str] = None) -> Iterable[Tuple[str, str, float, bytes]]:
+        """Iterate over (id, namespace, created, data) of all entries, or those of one namespace."""
+        query = "SELECT id, namespace FROM entries"
+        params = ()
+        if namespace:
+            query += " WHERE namespace = ?"
+            params = (namespace,)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        namespaces = dict(rows)
+        ids = list(namespaces)
+        for start in range(0, len(ids), 500):
+            for entry_id, (data, created) in self.load_many(ids[start:start + 500]).items():
+                yield entry_id, namespaces[entry_id], created, data
+
+class MemoryTier:
+    """Bounded LRU of entry contents with write-through to the backend.
+
+    Creation times are remembered for up to max_entries entries, including
+    entries known to be missing, so a key's metadata and content are read from
+    the backend once as long as it stays among them.
+    """
+
+    def __init__(self, max_bytes: int, max_entries: int = MEMORY_CACHE_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._values: "OrderedDict[str, str]" = OrderedDict()
+        self._created: "OrderedDict[str, Optional[float]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def known(self, entry_id: str) -> bool:
+        with self._lock:
+            return entry_id in self._created
+
+    def created(self, entry_id: str) -> Optional[float]:
+        with self._lock:
+            if entry_id in self._created:
+                self._created.move_to_end(entry_id)
+            return self._created.get(entry_id)
+
+    def lookup(self, entry_id: str) -> Tuple[bool, Optional[str]]:
+        """Returns whether the memory tier can answer, and the content if it is cached."""
+        with self._lock:
+            if entry_id in self._values:
+                self._values.move_to_end(entry_id)
+                self._created.move_to_end(entry_id)
+                self.hits += 1
+                return True, self._values[entry_id]
+            if entry_id in self._created and self._created[entry_id] is None:
+                self._created.move_to_end(entry_id)
+                self.hits += 1
+                return True, None
+            self.misses += 1
+            return False, None
+
+    def remember(self, entry_id: str, created: Optional[float], content: Optional[str] = None) -> None:
+        """Record an entry's creation time (None if missing) and content if given."""
+        with self._lock:
+            self._created[entry_id] = created
+            self._created.move_to_end(entry_id)
+            while len(self._created) > self.max_entries:
+                forgotten, _ = self._created.popitem(last=False)
+                if forgotten in self._values:
+                    self._size -= len(self._values.pop(forgotten))
+            if entry_id in self._values:
+                self._size -= len(self._values.pop(entry_id))
+            # Characters, which is close enough to bytes for mostly ASCII pages
+            if content is None or len(content) > self.max_bytes:
+                return
+            self._values[entry_id] = content
+            self._size += len(content)
+            while self._size > self.max_bytes:
+                _, evicted = self._values.popitem(last=False)
+                self._size -= len(evicted)
+
+    def forget_missing(self) -> None:
+        """Forget the entries known to be missing, so entries written by other processes are found."""
+        with self._lock:
+            for entry_id in [eid for eid, created in self._created.items() if created is None]:
+                del self._created[entry_id]
+
+    def forget(self, entry_id: str) -> None:
+        with self._lock:
+            self._created.pop(entry_id, None)
+            if entry_id in self._values:
+                self._size -= len(self._values.pop(entry_id))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._values), "bytes": self._size}
+
+_memory = MemoryTier(MEMORY_CACHE_BYTES)
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """Get the configured cache backend, migrating old cache files on first use of SQLite."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if CACHE_BACKEND == "files":
+                _backend = FileBackend(CACHE_DIR)
+            else:
+                is_new = not SQLITE_PATH.exists()
+                _backend = SQLiteBackend(SQLITE_PATH)
+                if is_new:
+                    migrate(_backend, CACHE_DIR)
+        return _backend
+
+def migrate(backend, directory: Path, batch_size: int = 500) -> int:
+    """Move the entries of a one-file-per-entry cache directory into a backend.
+
+    Returns:
+        Number of migrated entries
+    """
+    migrated = 0
+    batch = []
+    paths = []
+
+    def flush():
+        backend.store_many(batch)
+        for path in paths:
+            path.unlink()
+        batch.clear()
+        paths.clear()
+
+    for path in directory.iterdir():
+        match = LEGACY_FILE_PATTERN.match(path.name)
+        if not match or not path.is_file():
+            continue
+        with open(path, 'rb') as f:
+            batch.append((path.name, match.group(1), f.read(), path.stat().st_mtime))
+        paths.append(path)
+        migrated += 1
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    if migrated:
+        print(f"Migrated {migrated} cache files from {directory}")
+    return migrated
+
+def encode(namespace: str, content: str, level: int = COMPRESSION_LEVEL) -> bytes:
+    """Serialize content for the backend, compressing it for COMPRESSED_NAMESPACES."""
+    data = content.encode('utf-8')
+    if namespace in COMPRESSED_NAMESPACES:
+        return ZLIB_MARKER + zlib.compress(data, level)
+    return data
+
+def decode(data: bytes) -> str:
+    """Deserialize content from the backend, compressed or plain."""
+    if data.startswith(ZLIB_MARKER):
+        data = zlib.decompress(data[len(ZLIB_MARKER):])
+    return data.decode('utf-8')
+
+def entry_id(key: str) -> str:
+    """Get the id a key is stored under: its namespace and the hash of the full key."""
+    return namespace(key) + "_" + hash_string(key)
+
+def namespace(key: str) -> str:
+    return key.split(":")[0]
+
 def get_cache_path(key: str) -> Path:
     """Get the cache file path for a key."""
-    key_tokens = key.split(":")
-    hashed_key = key_tokens[0] + "_" + hash_string(key)
-    return CACHE_DIR / hashed_key
+    return CACHE_DIR / entry_id(key)
 
 def has(key: str) -> bool:
-    """Check if a cache entry exists."""
-    cache_path = get_cache_path(key)
-    if cache_path.exists():
-        print(f"Cache hit: {cache_path}")
-        return True
-    print(f"Cache miss: {cache_path}")
-    return False
+    """Check if a cache entry exists, reading only its metadata.
+
+    Use get() instead when the content is needed as well, so the backend is read once.
+    """
+    return _created_timestamp(key) is not None
 
 def get(key: str) -> Optional[str]:
     """Get content from cache if it exists."""
-    cache_path = get_cache_path(key)
-    if cache_path.exists():
-        try:
-            with open(cache_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        except Exception as e:
-            print(f"Error reading cache for {key}: {e}")
-    return None
+    eid = entry_id(key)
+    answered, content = _memory.lookup(eid)
+    if answered:
+        return content
+    try:
+        entry = get_backend().load(eid)
+    except Exception as e:
+        print(f"Error reading cache for {key}: {e}")
+        return None
+    if entry is None:
+        _memory.remember(eid, None)
+        return None
+    content = decode(entry[0])
+    _memory.remember(eid, entry[1], content)
+    return content
+
+def get_many(keys: Iterable[str]) -> Dict[str, Optional[str]]:
+    """Get the content of several keys at once, None for keys that are not cached."""
+    results = {}
+    missing = {}
+    for key in keys:
+        eid = entry_id(key)
+        answered, content = _memory.lookup(eid)
+        if answered:
+            results[key] = content
+        else:
+            missing[key] = eid
+    if not missing:
+        return results
+
+    try:
+        entries = get_backend().load_many(list(missing.values()))
+    except Exception as e:
+        print(f"Error reading cache: {e}")
+        entries = {}
+    for key, eid in missing.items():
+        if eid in entries:
+            data, created = entries[eid]
+            results[key] = decode(data)
+            _memory.remember(eid, created, results[key])
+        else:
+            results[key] = None
+            _memory.remember(eid, None)
+    return results
 
 def put(key: str, content: str) -> None:
     """Store content in cache."""
-    cache_path = get_cache_path(key)
+    put_many({key: content})
+
+def put_many(items: Dict[str, str]) -> None:
+    """Store several entries at once."""
+    now = time.time()
+    entries = [(entry_id(key), namespace(key), encode(namespace(key), content), now) for key, content in items.items()]
     try:
-        with open(cache_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        get_backend().store_many(entries)
     except Exception as e:
-        print(f"Error writing cache for {key}: {e}")
+        print(f"Error writing cache for {', '.join(items)}: {e}")
+        return
+    for key, content in items.items():
+        _memory.remember(entry_id(key), now, content)
+
+def delete(key: str) -> None:
+    """Remove a cache entry if it exists."""
+    try:
+        get_backend().remove(entry_id(key))
+    except Exception as e:
+        print(f"Error deleting cache for {key}: {e}")
+        return
+    _memory.remember(entry_id(key), None)
+
+def _created_timestamp(key: str) -> Optional[float]:
+    """Get the creation time of an entry, reading only its metadata from the backend."""
+    eid = entry_id(key)
+    if _memory.known(eid):
+        return _memory.created(eid)
+    try:
+        timestamp = get_backend().stat(eid)
+    except Exception as e:
+        print(f"Error reading cache for {key}: {e}")
+        return None
+    _memory.remember(eid, timestamp)
+    return timestamp
+
+def forget_missing() -> None:
+    """Look up entries remembered as missing in the backend again, e.g. after another process wrote to it."""
+    _memory.forget_missing()
+
+def memory_stats() -> Dict[str, int]:
+    """Get the hit/miss counters and size of the in-memory tier."""
+    return _memory.stats()
+
+def get_validators(key: str) -> Dict[str, Any]:
+    """Get the HTTP validators (ETag, Last-Modified, time of last check) stored for a cache entry."""
+    data = get("meta:" + key)
+    if data is None:
+        return {}
+    try:
+        return json.loads(data)
+    except ValueError:
+        return {}
+
+def put_validators(key: str, validators: Dict[str, Any]) -> None:
+    """Store the HTTP validators of a cache entry."""
+    put("meta:" + key, json.dumps(validators))
 
 def created(key: str) -> Optional[datetime.datetime]:
     """Get the date of a cached item.
@@ -49,28 +481,94 @@ def created(key: str) -> Optional[datetime.datetime]:
     Returns:
         Date when the cache was created, or None if not found
     """
-    cache_path = get_cache_path(key)
-    if cache_path.exists():
-        mtime = cache_path.stat().st_mtime
-        file_date = datetime.datetime.fromtimestamp(mtime)
-        return file_date
+    timestamp = _created_timestamp(key)
+    if timestamp is not None:
+        return datetime.datetime.fromtimestamp(timestamp)
     return None
 
 def age(key: str) -> Optional[int]:
     """Get the age of a cached item in calendar days.
 
     Returns:
-        Number of calendar days since the cache was created, or None if not found
+        Number of calendar days since the cache was created, or 0 if not found
     """
-    cache_path = get_cache_path(key)
-    if cache_path.exists():
-        mtime = cache_path.stat().st_mtime
-        file_date = date.fromtimestamp(mtime)
+    timestamp = _created_timestamp(key)
+    if timestamp is not None:
+        file_date = date.fromtimestamp(timestamp)
         today = date.today()
         days_diff = (today - file_date).days
         return days_diff
     return 0
 
+def gc(max_bytes: Optional[int] = None, dry_run: bool = False, vacuum: bool = False) -> Dict[str, int]:
+    """Delete entries older than the TTL of their namespace.
+
+    With max_bytes the oldest remaining entries are evicted as well until the
+    cache fits, except for namespaces that are kept forever.
+
+    Returns:
+        Counts of expired and evicted entries and the bytes reclaimed
+    """
+    backend = get_backend()
+    now = time.time()
+    expired = []
+    kept = []
+    for entry in backend.entries():
+        ttl = TTLS.get(entry[1], DEFAULT_TTL)
+        if ttl is not None and now - entry[2] > ttl:
+            expired.append(entry)
+        else:
+            kept.append(entry)
+
+    evicted = []
+    if max_bytes is not None:
+        total = sum(entry[3] for entry in kept)
+        evictable = sorted((entry for entry in kept if TTLS.get(entry[1], DEFAULT_TTL) is not None), key=lambda e: e[2])
+        for entry in evictable:
+            if total <= max_bytes:
+                break
+            evicted.append(entry)
+            total -= entry[3]
+
+    removed = [entry[0] for entry in expired + evicted]
+    if removed and not dry_run:
+        backend.remove_many(removed)
+        for eid in removed:
+            _memory.forget(eid)
+        if vacuum:
+            backend.compact()
+
+    return {
+        "entries": len(expired) + len(kept),
+        "expired": len(expired),
+        "evicted": len(evicted),
+        "reclaimed_bytes": sum(entry[3] for entry in expired + evicted),
+    }
+
 def hash_string(s: str) -> str:
     """Create a hash of a string."""
-    return hashlib.sha256(s.encode('utf-8')).hexdigest() 
\ No newline at end of file
+    return hashlib.sha256(s.encode('utf-8')).hexdigest()
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain the news-bot cache')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('migrate', help='Move one-file-per-entry cache files into the SQLite cache')
+    gc_parser = commands.add_parser('gc', help='Delete expired entries and shrink the cache to a size limit')
+    gc_parser.add_argument('--max-size-mb', type=float, help='Evict the oldest entries until the cache fits')
+    gc_parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted')
+    gc_parser.add_argument('--vacuum', action='store_true', help='Compact the SQLite database afterwards')
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        migrate(SQLiteBackend(SQLITE_PATH), CACHE_DIR)
+    elif args.command == 'gc':
+        start = time.time()
+        max_bytes = int(args.max_size_mb * 1024 * 1024) if args.max_size_mb is not None else None
+        result = gc(max_bytes=max_bytes, dry_run=args.dry_run, vacuum=args.vacuum)
+        print(f"Checked {result['entries']} entries in {time.time() - start:.2f}s: "
+              f"{result['expired']} expired, {result['evicted']} evicted, "
+              f"{result['reclaimed_bytes'] / (1024 * 1024):.1f} MB reclaimed"
+              + (" (dry run)" if args.dry_run else ""))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from typing import Callable, Dict, List, Optional, Set
+
+import cache
+from sources import NewsFetcherFactory
+from sources.article import Article
+from sources.duplicates import Deduplicator
+from sources.factory import DISCOVERY_TIMEOUT
+from sources.seen import SeenIndex, record_seen
+from agents.news_assistant import NewsAssistant
+from agents.digest_assistant import DigestAssistant
+from agents.async_summarizer import AsyncSummarizer
+from pipeline import clean_pool, process_articles, DEFAULT_WORKERS, DEFAULT_CLEAN_WORKERS
+
+# Seconds between two polls of a source without poll_interval in its config
+DEFAULT_POLL_INTERVAL = 15 * 60
+# Seconds after which new articles are put into the digest at the latest
+DIGEST_INTERVAL = 60 * 60
+# New articles that get the digest updated right away, without waiting for DIGEST_INTERVAL
+DIGEST_MIN_ARTICLES = 10
+# Seconds before a digest that failed, e.g. because the model did not answer, is attempted again
+DIGEST_RETRY_DELAY = 5 * 60
+
+
+class Daemon:
+    """Keeps the digest of the day up to date from one long-running process.
+
+    Each source is polled on the poll_interval of its config. Articles new
+    since the last poll are fetched and summarized as they show up, and the
+    digest is updated incrementally once DIGEST_MIN_ARTICLES new articles came
+    in, or DIGEST_INTERVAL after the first one. The assistants, HTTP sessions,
+    seen and signature indexes, the memory tier of the cache and the process
+    pool cleaning the HTML stay loaded between polls. Expired cache entries
+    are deleted when the day changes.
+    """
+
+    def __init__(self, factory: NewsFetcherFactory, sources: List[str], news_assistant: NewsAssistant,
+                 digest_assistant: DigestAssistant, publish: Callable[[List[Article], str, date], None],
+                 workers: int = DEFAULT_WORKERS, clean_workers: int = DEFAULT_CLEAN_WORKERS,
+                 summarizer: Optional[AsyncSummarizer] = None, pack: bool = False, deduplicate: bool = True,
+                 discovery_timeout: float = DISCOVERY_TIMEOUT, digest_interval: float = DIGEST_INTERVAL,
+                 digest_min_articles: int = DIGEST_MIN_ARTICLES):
+        self.factory = factory
+        self.sources = sources
+        self.news_assistant = news_assistant
+        self.digest_assistant = digest_assistant
+        self.publish = publish
+        self.workers = workers
+        self.clean_workers = clean_workers
+        self.summarizer = summarizer
+        self.pack = pack
+        self.deduplicate = deduplicate
+        self.discovery_timeout = discovery_timeout
+        self.digest_interval = digest_interval
+        self.digest_min_articles = digest_min_articles
+
+        self.seen = {source: SeenIndex(source) for source in sources}
+        self.next_poll = {source: 0.0 for source in sources}
+        # Sources polled since the start, later polls take up no articles accepted by other runs
+        self.polled: Set[str] = set()
+        self.digest_retry_at = 0.0
+        self.stopping = threading.Event()
+        self._start_day()
+
+    def _start_day(self) -> None:
+        """Forget the articles of the previous day, the digest of the new day starts empty."""
+        self.day = date.today()
+        # Articles of the day by URL, processed without error
+        self.articles: Dict[str, Article] = {}
+        self.deduplicator = Deduplicator() if self.deduplicate else None
+        # Articles accepted by an earlier run that failed here, taken up again on the next poll
+        self.retry: Set[str] = set()
+        # New articles not in the digest yet, and when the first of them came in
+        self.changed = 0
+        self.changed_since: Optional[float] = None
+
+    def poll_interval(self, source: str) -> float:
+        return float(self.factory.load_config(source).get('poll_interval') or DEFAULT_POLL_INTERVAL)
+
+    def run(self) -> None:
+        """Poll and write digests until SIGINT or SIGTERM, finishing the current poll first."""
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: self.stopping.set())
+        print(f"Polling {len(self.sources)} sources: " + ", ".join(
+            f"{source} every {self.poll_interval(source):.0f}s" for source in self.sources))
+
+        with clean_pool(self.clean_workers) as processes:
+            while not self.stopping.is_set():
+                if date.today() != self.day:
+                    self._end_day()
+                now = time.monotonic()
+                due = [source for source in self.sources if self.next_poll[source] <= now]
+                if due:
+                    try:
+                        self.poll(due, processes)
+                    except Exception as e:
+                        print(f"Polling {', '.join(due)} failed: {str(e)}")
+                    for source in due:
+                        self.next_poll[source] = time.monotonic() + self.poll_interval(source)
+                if self.digest_due():
+                    self.write_digest()
+                self.stopping.wait(self.seconds_to_wake())
+        print("Stopped polling")
+
+    def _end_day(self) -> None:
+        """Put the articles still missing into the digest of the ending day and start the next one."""
+        if self.changed_since is not None:
+            self.write_digest()
+        if self.deduplicator:
+            self.deduplicator.save()
+        self._start_day()
+        result = cache.gc()
+        print(f"Cache: {result['expired']} of {result['entries']} entries expired")
+
+    def poll(self, sources: List[str], processes: Optional[ProcessPoolExecutor] = None) -> List[Article]:
+        """Process the articles of the sources not processed yet, returning the new ones."""
+        # Summaries written meanwhile by other processes, e.g. --batch-collect, are to be found
+        cache.forget_missing()
+        discovered = self.factory.discover_articles(sources, timeout=self.discovery_timeout)
+        unprocessed = sorted((a for a in discovered if a.source_url not in self.articles), key=lambda a: a.source_url)
+        new_articles = [a for a in unprocessed
+                        if not self.seen[a.source_name].is_known(a.source_url) and a.is_from_today()]
+        # Articles accepted by runs before the start are needed for the digest, their summaries are cached.
+        # Those accepted by this process are in self.articles already.
+        known_articles = [a for a in unprocessed if (a.source_name not in self.polled or a.source_url in self.retry)
+                          and self.seen[a.source_name].accepted_today(a.source_url)]
+        print(f"Polled {', '.join(sources)}: {len(new_articles)} new articles")
+
+        # In one call, so new articles repeating the story of a known one are attached to it
+        process_articles(known_articles + new_articles, self.news_assistant, workers=self.workers,
+                         clean_workers=self.clean_workers, summarizer=self.summarizer, pack=self.pack,
+                         deduplicator=self.deduplicator, processes=processes)
+        if self.deduplicator:
+            self.deduplicator.save()
+        # Failed articles are neither recorded as seen nor kept, so the next poll retries them
+        record_seen(discovered, {source: self.seen[source] for source in sources},
+                    accepted=new_articles + known_articles)
+        self.polled.update(sources)
+        for article in new_articles + known_articles:
+            if not article.error:
+                self.articles[article.source_url] = article
+        for article in known_articles:
+            if article.error:
+                self.retry.add(article.source_url)
+            else:
+                self.retry.discard(article.source_url)
+
+        added = sum(1 for article in new_articles if not article.error)
+        loaded = sum(1 for article in known_articles if not article.error)
+        if added or loaded:
+            self.changed += added + loaded
+            if self.changed_since is None:
+                self.changed_since = time.monotonic()
+        if loaded:
+            # Articles of the runs before the start may be missing from the published digest, e.g. after a
+            # crash, so it is written right away. Unchanged, it comes from the cache without a request.
+            self.changed_since = min(self.changed_since, time.monotonic() - self.digest_interval)
+        return new_articles
+
+    def digest_due(self) -> bool:
+        if self.changed_since is None or time.monotonic() < self.digest_retry_at:
+            return False
+        return (self.changed >= self.digest_min_articles
+                or time.monotonic() - self.changed_since >= self.digest_interval)
+
+    def write_digest(self) -> bool:
+        """Update the digest of the day with the articles changed since the last one and publish it.
+
+        Returns:
+            Whether it was published, if not the changes stay pending and it is retried after DIGEST_RETRY_DELAY
+        """
+        articles = sorted(self.articles.values(), key=lambda a: a.source_url)
+        print(f"Updating the digest with {self.changed} articles not in it yet, {len(articles)} articles today")
+        try:
+            # The sources of duplicates are listed with the article summarized for them
+            digest = self.digest_assistant.create_digest([a for a in articles if not a.duplicate_of],
+                                                         incremental=True, day=self.day)
+            self.publish(articles, digest, self.day)
+        except Exception as e:
+            print(f"Writing the digest failed, retrying in {DIGEST_RETRY_DELAY}s: {str(e)}")
+            self.digest_retry_at = time.monotonic() + DIGEST_RETRY_DELAY
+            return False
+        self.changed = 0
+        self.changed_since = None
+        return True
+
+    def seconds_to_wake(self) -> float:
+        """Seconds until the next source is due, or the pending articles go into the digest."""
+        wake = min(self.next_poll.values(), default=time.monotonic() + DEFAULT_POLL_INTERVAL)
+        if self.changed_since is not None:
+            digest_at = self.changed_since + self.digest_interval
+            if self.changed >= self.digest_min_articles:
+                digest_at = 0.0
+            wake = min(wake, max(digest_at, self.digest_retry_at))
+        return max(wake - time.monotonic(), 1.0)
@@ -1,6 +1,15 @@
-from datetime import datetime
+import json
+import os
+import re
+from datetime import date, datetime
 from pathlib import Path
-import chevron
+from typing import Dict, List, Optional
+
+from formatters.templates import render
+
+# Digests listed on the index page, older ones are found on the archive pages of their month
+INDEX_SIZE = 31
+DIGEST_FILE_PATTERN = re.compile(r"^digest-(\d{4})(\d{2})(\d{2})\.html$")
 
 
 def format_digest(digest: str) -> str:
@@ -22,26 +31,122 @@ def format_digest(digest: str) -> str:
     """
 
 
-def generate_digest_index(digests_dir: Path) -> str:
-	"""Generate an index.html file listing all digests in descending date order."""
-	digest_files = sorted(
-		[f for f in digests_dir.glob("digest-*.html") if f.is_file()],
-		key=lambda x: x.stem[7:17],  # Sort by date part of filename
-		reverse=True
-	)
+class DigestManifest:
+	"""Published digests, in one small JSON file per month and a list of the months.
+
+	Publishing a digest touches only the file of its month, so the work per
+	run does not grow with the number of digests.
+	"""
+
+	def __init__(self, digests_dir: Path):
+		self.directory = digests_dir / 'manifest'
+		self.months_path = self.directory / 'months.json'
+		self.imported = False
+		if not self.months_path.exists():
+			self._import(digests_dir)
+			self.imported = True
+
+	def months(self) -> List[str]:
+		"""Months with digests as YYYY-MM, newest first."""
+		return sorted(_read_json(self.months_path, {}), reverse=True)
+
+	def month(self, month: str) -> List[Dict]:
+		"""Digests of a month, newest first."""
+		entries = _read_json(self.directory / f'{month}.json', {})
+		return [entries[day] for day in sorted(entries, reverse=True)]
+
+	def recent(self, count: int) -> List[Dict]:
+		"""The newest digests, reading only as many months as needed."""
+		digests: List[Dict] = []
+		for month in self.months():
+			if len(digests) >= count:
+				break
+			digests.extend(self.month(month))
+		return digests[:count]
+
+	def publish(self, filename: str, day: date, articles: Optional[int] = None) -> str:
+		"""Record a digest, replacing an earlier one of the same day, and return its month."""
+		month = day.strftime('%Y-%m')
+		path = self.directory / f'{month}.json'
+		entries = _read_json(path, {})
+		entries[day.isoformat()] = {'filename': filename, 'date': day.isoformat(), 'articles': articles}
+		_write_json(path, entries)
+
+		months = _read_json(self.months_path, {})
+		if months.get(month) != len(entries):
+			months[month] = len(entries)
+			_write_json(self.months_path, months)
+		return month
+
+	def _import(self, digests_dir: Path) -> None:
+		"""Build the manifest from the digest files, once for directories of older versions."""
+		for f in sorted(digests_dir.glob('digest-*.html')):
+			match = DIGEST_FILE_PATTERN.match(f.name)
+			if match:
+				self.publish(f.name, date(*map(int, match.groups())))
+		if not self.months_path.exists():
+			_write_json(self.months_path, {})
+
+
+def _read_json(path: Path, default):
+	if not path.exists():
+		return default
+	try:
+		with open(path, 'r', encoding='utf-8') as f:
+			return json.load(f)
+	except (OSError, ValueError) as e:
+		print(f"Error reading digest manifest {path}: {e}")
+		return default
 
+
+def _write_json(path: Path, data) -> None:
+	path.parent.mkdir(parents=True, exist_ok=True)
+	tmp_path = path.with_suffix('.tmp')
+	with open(tmp_path, 'w', encoding='utf-8') as f:
+		json.dump(data, f, indent=1)
+	os.replace(tmp_path, path)
+
+
+def archive_filename(month: str) -> str:
+	return f'archive-{month}.html'
+
+
+def _month_links(manifest: DigestManifest) -> List[Dict]:
+	return [
+		{'month': month, 'label': datetime.strptime(month, '%Y-%m').strftime('%m/%Y'), 'filename': archive_filename(month)}
+		for month in manifest.months()
+	]
+
+
+def generate_digest_index(manifest: DigestManifest) -> str:
+	"""Render the index page with the newest digests and links to the archive pages of all months."""
+	context = {
+		'digests': manifest.recent(INDEX_SIZE),
+		'months': _month_links(manifest),
+	}
+	return render('index.html.mustache', context)
+
+
+def generate_month_archive(manifest: DigestManifest, month: str) -> str:
+	"""Render the archive page listing the digests of a month."""
 	context = {
-		'digests': [
-			{
-				'filename': f.name,
-				'date': f.stem[7:17][0:4] + '-' + f.stem[7:17][4:6] + '-' + f.stem[7:17][6:8],
-			}
-			for f in digest_files
-		]
+		'month': datetime.strptime(month, '%Y-%m').strftime('%m/%Y'),
+		'digests': manifest.month(month),
 	}
+	return render('archive.html.mustache', context)
+
 
-	template_path = Path(__file__).parent / 'templates' / 'index.html.mustache'
-	with open(template_path, 'r', encoding='utf-8') as f:
-		template = f.read()
+def publish_digest(digests_dir: Path, filename: str, day: date, articles: Optional[int] = None) -> Dict[str, str]:
+	"""Record a digest in the manifest and render the pages listing it.
 
-	return chevron.render(template, context)
\ No newline at end of file
+	Returns:
+		HTML of the index page and of the archive page of the digest's month, by file name
+	"""
+	manifest = DigestManifest(digests_dir)
+	# The archive pages of all months are rendered once after the manifest was built from the digest files
+	months = manifest.months() if manifest.imported else []
+	month = manifest.publish(filename, day, articles)
+	pages = {'index.html': generate_digest_index(manifest)}
+	for archived in set(months) | {month}:
+		pages[archive_filename(archived)] = generate_month_archive(manifest, archived)
+	return pages
@@ -1,12 +1,9 @@
-from datetime import datetime
-from pathlib import Path
-import chevron
+from datetime import date
+from formatters.templates import render
 
-def generate_html(articles, digest):
-    template_path = Path(__file__).parent / 'templates' / 'digest.html.mustache'
-    
+def generate_html(articles, digest, day=None):
     context = {
-        'date': datetime.now().strftime('%d.%m.%Y'),
+        'date': (day or date.today()).strftime('%d.%m.%Y'),
         'digest': digest,
         'articles': [
             {
@@ -18,9 +15,5 @@ def generate_html(articles, digest):
             for article in articles
         ]
     }
-    
-    with open(template_path, 'r', encoding='utf-8') as f:
-        template = f.read()
-    
-    html = chevron.render(template, context)
-    return html
\ No newline at end of file
+
+    return render('digest.html.mustache', context)
\ No newline at end of file
@@ -0,0 +1,19 @@
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import chevron
+from chevron.tokenizer import tokenize
+
+TEMPLATES_DIR = Path(__file__).parent / 'templates'
+
+
+@lru_cache(maxsize=None)
+def compile_template(name: str) -> List[Tuple[str, str]]:
+    """Read and tokenize a template of the templates directory once per process."""
+    with open(TEMPLATES_DIR / name, 'r', encoding='utf-8') as f:
+        return list(tokenize(f.read()))
+
+
+def render(name: str, context: Dict[str, Any]) -> str:
+    return chevron.render(compile_template(name), context)
@@ -1,11 +1,23 @@
 import argparse
 from pathlib import Path
-from datetime import datetime
-from formatters.digest_formatter import generate_digest_index
+from datetime import date
+from typing import List, Optional
+from formatters.digest_formatter import publish_digest
 from formatters.html import generate_html
+import cache
 from sources import NewsFetcherFactory
-from agents.news_assistant import NewsAssistant
-from agents.digest_assistant import DigestAssistant
+from sources.factory import DISCOVERY_TIMEOUT
+from sources.seen import SeenIndex, record_seen
+from sources.duplicates import Deduplicator
+from sources.article import Article
+from sources.fetcher import configure_pool, connection_stats, download_stats, POOL_MAXSIZE
+from agents.news_assistant import NewsAssistant, PACK_MAX_CHARS, PACK_SIZE
+from agents.digest_assistant import DigestAssistant, DIGEST_MODES, HIERARCHICAL_THRESHOLD
+from agents.base import BACKENDS, DEFAULT_BACKEND
+from agents.async_summarizer import AsyncSummarizer, DEFAULT_CONCURRENCY, DEFAULT_RPM, DEFAULT_TPM
+from agents.batch import BatchSubmitter, collect_batches
+from pipeline import process_articles, DEFAULT_WORKERS, DEFAULT_CLEAN_WORKERS
+from daemon import Daemon, DIGEST_INTERVAL, DIGEST_MIN_ARTICLES
 
 home = Path.home()
 digests_dir = home / '.news-bot' / 'digests'
@@ -17,41 +29,172 @@ def main():
     parser = argparse.ArgumentParser(description='Generate news digest from regional sources')
     parser.add_argument('--ignore-cached-news', action='store_true', 
                        help='Ignore previously cached articles when generating the digest')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                       help=f'Number of articles fetched and summarized concurrently (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--clean-workers', type=int, default=DEFAULT_CLEAN_WORKERS,
+                       help=f'Number of processes cleaning downloaded HTML (default: {DEFAULT_CLEAN_WORKERS})')
+    parser.add_argument('--pool-size', type=int, default=POOL_MAXSIZE,
+                       help=f'Maximum number of open connections per host (default: {POOL_MAXSIZE})')
+    parser.add_argument('--discovery-timeout', type=float, default=DISCOVERY_TIMEOUT,
+                       help=f'Seconds to wait for the source index pages before skipping slow sources (default: {DISCOVERY_TIMEOUT})')
+    parser.add_argument('--since-last-run', action='store_true',
+                       help='Only process articles not seen in a previous run, and skip the digest if there are none')
+    parser.add_argument('--llm-backend', choices=BACKENDS, default=DEFAULT_BACKEND,
+                       help=f'OpenAI API used for summaries and the digest: one chat completion per request, or assistant threads and runs (default: {DEFAULT_BACKEND})')
+    parser.add_argument('--async-summaries', action='store_true',
+                       help='Request the summaries concurrently on an event loop, within the --rpm and --tpm budgets')
+    parser.add_argument('--summary-concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                       help=f'Summaries requested at the same time with --async-summaries (default: {DEFAULT_CONCURRENCY})')
+    parser.add_argument('--rpm', type=int, default=DEFAULT_RPM,
+                       help=f'Requests per minute allowed for --async-summaries (default: {DEFAULT_RPM})')
+    parser.add_argument('--tpm', type=int, default=DEFAULT_TPM,
+                       help=f'Tokens per minute allowed for --async-summaries (default: {DEFAULT_TPM})')
+    parser.add_argument('--pack-short-articles', action='store_true',
+                       help=f'Summarize articles of up to {PACK_MAX_CHARS} characters {PACK_SIZE} at a time with one request')
+    parser.add_argument('--batch-submit', action='store_true',
+                       help='Submit the summaries not cached yet as a job of the OpenAI Batch API and stop before the digest')
+    parser.add_argument('--batch-collect', action='store_true',
+                       help='Put the summaries of finished batch jobs into the cache before processing the articles')
+    parser.add_argument('--digest-mode', choices=DIGEST_MODES, default="auto",
+                       help=f'Write the digest with one request, or per topic group and merge the parts; '
+                            f'auto does the latter above {HIERARCHICAL_THRESHOLD} articles (default: auto)')
+    parser.add_argument('--incremental-digest', action='store_true',
+                       help='Update the last digest of the day with the new and changed articles instead of writing it anew')
+    parser.add_argument('--keep-duplicates', action='store_true',
+                       help='Summarize every article, also those telling the same story as another one')
+    parser.add_argument('--daemon', action='store_true',
+                       help='Keep running, poll each source on the poll_interval of its config and update the digest '
+                            'of the day as new articles come in; stops with SIGINT or SIGTERM')
+    parser.add_argument('--digest-interval', type=float, default=DIGEST_INTERVAL,
+                       help=f'Seconds after which new articles go into the digest with --daemon (default: {DIGEST_INTERVAL})')
+    parser.add_argument('--digest-min-articles', type=int, default=DIGEST_MIN_ARTICLES,
+                       help=f'New articles that get the digest updated right away with --daemon (default: {DIGEST_MIN_ARTICLES})')
+    args = parser.parse_args()
+    if args.async_summaries and args.llm_backend != "chat":
+        parser.error('--async-summaries needs --llm-backend chat')
+    if args.batch_submit and (args.async_summaries or args.pack_short_articles):
+        parser.error('--batch-submit cannot be combined with --async-summaries or --pack-short-articles')
+    if args.daemon and args.batch_submit:
+        parser.error('--daemon cannot be combined with --batch-submit')
+    configure_pool(pool_maxsize=args.pool_size)
 
     # Initialize
     factory = NewsFetcherFactory()
     sources = factory.get_available_sources()
     digests_dir.mkdir(parents=True, exist_ok=True)
-    news_assistant = NewsAssistant()
-    digest_assistant = DigestAssistant()
+    news_assistant = NewsAssistant(backend=args.llm_backend)
+    digest_assistant = DigestAssistant(backend=args.llm_backend, mode=args.digest_mode)
 
     if not sources:
         print("No source configurations found!")
         return
         
     print(f"Found {len(sources)} sources: {', '.join(sources)}")
-    
+
+    if args.daemon:
+        if args.batch_collect:
+            print(f"Collected {collect_batches(news_assistant)} summaries of batch jobs")
+        summarizer = None
+        if args.async_summaries:
+            summarizer = AsyncSummarizer(news_assistant, concurrency=args.summary_concurrency, rpm=args.rpm, tpm=args.tpm)
+        try:
+            Daemon(factory, sources, news_assistant, digest_assistant, publish, workers=args.workers,
+                   clean_workers=args.clean_workers, summarizer=summarizer, pack=args.pack_short_articles,
+                   deduplicate=not args.keep_duplicates, discovery_timeout=args.discovery_timeout,
+                   digest_interval=args.digest_interval, digest_min_articles=args.digest_min_articles).run()
+        finally:
+            if summarizer:
+                summarizer.close()
+        return
+
     # Step 1: Gather URLs
     articles = sorted(
-        [article for source in sources for article in NewsFetcherFactory().create_fetcher(source).fetch_articles()],
+        factory.discover_articles(sources, timeout=args.discovery_timeout),
         key=lambda a: a.source_url
     )
 
-    articles = [article for article in articles if article.is_from_today()]
-    print(f"Identified {len(articles)} articles from today.")
+    discovered = articles
+    seen = {source: SeenIndex(source) for source in sources}
+    if args.since_last_run:
+        # Known articles are decided on the seen index alone, without looking at the caches
+        new_articles = [a for a in articles if not seen[a.source_name].is_known(a.source_url)]
+        new_articles = [article for article in new_articles if article.is_from_today()]
+        print(f"Identified {len(new_articles)} articles new since the last run.")
+        # Only articles processed by an earlier run today, old articles linked again are left out
+        known_articles = [a for a in articles if seen[a.source_name].accepted_today(a.source_url)]
+        articles = sorted(new_articles + known_articles, key=lambda a: a.source_url)
+    else:
+        articles = [article for article in articles if article.is_from_today()]
+        print(f"Identified {len(articles)} articles from today.")
+        new_articles = articles
+        known_articles = []
 
-    # Step 2: Fetch and clean content
-    for i, article in enumerate(articles, 1):
-        print(f"Processing {i} of {len(articles)}")
-        article.fetch()
-        news_assistant.analyze_article(article)
+    if args.since_last_run and not new_articles:
+        print("Nothing new since the last run, keeping the current digest.")
+        record_seen(discovered, seen)
+        return
 
-    # Step 3: Generate digest
-    digest = digest_assistant.create_digest(articles)
+    # Step 2: Fetch, clean and summarize content
+    if args.batch_collect:
+        print(f"Collected {collect_batches(news_assistant)} summaries of batch jobs")
+    deduplicator = None if args.keep_duplicates else Deduplicator()
+    summarizer = None
+    if args.batch_submit:
+        summarizer = BatchSubmitter(news_assistant)
+    elif args.async_summaries:
+        summarizer = AsyncSummarizer(news_assistant, concurrency=args.summary_concurrency, rpm=args.rpm, tpm=args.tpm)
+    try:
+        # Articles of earlier runs today are needed for the digest, their summaries are cached. They go
+        # first and in the same call, so new articles repeating their stories are attached to them.
+        process_articles(known_articles + new_articles, news_assistant, workers=args.workers,
+                         clean_workers=args.clean_workers, summarizer=summarizer, pack=args.pack_short_articles,
+                         deduplicator=deduplicator)
+    finally:
+        if isinstance(summarizer, AsyncSummarizer):
+            summarizer.close()
+            print(f"Summaries rate limited by the API: {summarizer.rate_limited} times")
+    if deduplicator:
+        deduplicator.save()
+        duplicates = sum(1 for article in articles if article.duplicate_of)
+        print(f"Same story as another article: {duplicates} in this run, {deduplicator.reused} from earlier runs")
+    if isinstance(summarizer, BatchSubmitter):
+        batch_id = summarizer.close()
+        if batch_id:
+            # Not recorded as seen, so --since-last-run takes the articles up again once the batch is collected
+            print(f"Submitted batch {batch_id} with {len(summarizer.requests)} summaries, collect it with --batch-collect")
+            return
+
+    # Step 3: Generate digest, the sources of duplicates are listed with the article summarized for them
+    digest = digest_assistant.create_digest([article for article in articles if not article.duplicate_of],
+                                            incremental=args.incremental_digest)
 
     # Step 4: Format and save result
-    write_html(f"digest-{datetime.now().strftime('%Y%m%d')}.html",generate_html(articles, digest))
-    write_html("index.html", generate_digest_index(digests_dir))
+    publish(articles, digest)
+    # Recorded only once published, so --since-last-run takes the articles up again if a step before failed
+    record_seen(discovered, seen, accepted=articles)
+
+    stats = connection_stats()
+    print(f"HTTP connections: {stats['opened']} opened, {stats['reused']} reused for {stats['requests']} requests")
+    stats = download_stats()
+    print(f"Downloads cut off early: {stats['truncated']}, {stats['bytes_saved']} bytes saved")
+    for source, counts in sorted(news_assistant.input_stats().items()):
+        saved = 1 - counts['sent'] / counts['cleaned'] if counts['cleaned'] else 0
+        print(f"Input tokens {source}: ~{counts['sent']} instead of ~{counts['cleaned']} for {counts['articles']} articles ({saved:.0%} less)")
+    for label, assistant in (("Summary", news_assistant), ("Digest", digest_assistant)):
+        stats = assistant.latency_stats()
+        if stats['count']:
+            print(f"{label} latency ({args.llm_backend}): {stats['count']} requests, mean {stats['mean']:.1f}s, "
+                  f"p50 {stats['p50']:.1f}s, p95 {stats['p95']:.1f}s, max {stats['max']:.1f}s")
+    stats = cache.memory_stats()
+    print(f"Memory cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries ({stats['bytes']} bytes)")
+
+def publish(articles: List[Article], digest: str, day: Optional[date] = None) -> None:
+    """Write the digest page of the day, today unless given, and the pages listing the digests."""
+    day = day or date.today()
+    filename = f"digest-{day.strftime('%Y%m%d')}.html"
+    write_html(filename, generate_html(articles, digest, day))
+    for page, html in publish_digest(digests_dir, filename, day, len(articles)).items():
+        write_html(page, html)
     copy_file(Path(__file__).parent / 'formatters' / 'templates' / 'styles.css')
 
 def write_html(filename: str, content: str) -> None:
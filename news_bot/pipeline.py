@@ -0,0 +1,119 @@
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import ExitStack
+from typing import Dict, List, Optional, Tuple, Union
+
+import cache
+from sources.article import Article
+from sources.duplicates import Deduplicator
+from sources.extractor import process_page
+from agents.async_summarizer import AsyncSummarizer
+from agents.batch import BatchSubmitter
+from agents.news_assistant import PACK_SIZE, NewsAssistant
+
+DEFAULT_WORKERS = 8
+# Cleaning is CPU-bound, so it gets one process per core available to us
+DEFAULT_CLEAN_WORKERS = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+# Cleaned articles written to the cache at once
+CACHE_BATCH_SIZE = 32
+
+# Cleaning processes forked while download threads hold locks could inherit them locked for good, so
+# they are started from a separate server process that has no threads
+CLEAN_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+FETCH, CLEAN, SUMMARIZE = "fetch", "clean", "summarize"
+
+
+def clean_pool(workers: int = DEFAULT_CLEAN_WORKERS) -> ProcessPoolExecutor:
+    """Start a process pool for cleaning the downloaded HTML."""
+    return ProcessPoolExecutor(max_workers=max(1, workers), mp_context=multiprocessing.get_context(CLEAN_START_METHOD))
+
+
+def process_articles(articles: List[Article], news_assistant: NewsAssistant, workers: int = DEFAULT_WORKERS,
+                     clean_workers: int = DEFAULT_CLEAN_WORKERS,
+                     summarizer: Optional[Union[AsyncSummarizer, BatchSubmitter]] = None, pack: bool = False,
+                     deduplicator: Optional[Deduplicator] = None,
+                     processes: Optional[ProcessPoolExecutor] = None) -> None:
+    """Fetch, clean and summarize articles with bounded pools of workers.
+
+    Downloads and summaries run in threads, the HTML cleaning and article text
+    extraction run in a process pool. With a summarizer, the summaries are
+    requested through it instead of the threads. With pack, short articles are
+    summarized PACK_SIZE at a time with one request. With a deduplicator, only
+    one article per story is summarized and the others get its summary. Each
+    article moves on to the next stage as soon as it is through the previous
+    one. A process pool kept by the caller can be given in processes, otherwise
+    one is started for the call. Results are written to the articles themselves, so the order of the
+    given list is kept. Failures are recorded in Article.error and do not stop
+    the run.
+    """
+    total = len(articles)
+    done = 0
+    pending: Dict[Future, Tuple[str, Article]] = {}
+    batch: Dict[str, str] = {}
+    # Short articles waiting for a pack, and the packs being summarized
+    packing: List[Article] = []
+    packs: Dict[Future, List[Article]] = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as threads, ExitStack() as stack:
+        if processes is None:
+            processes = stack.enter_context(clean_pool(clean_workers))
+        for article in articles:
+            pending[threads.submit(article.fetch)] = (FETCH, article)
+
+        while pending or packs or packing:
+            # A pack goes out when it is full, or when no more articles can join it
+            upstream = any(stage != SUMMARIZE for stage, _ in pending.values())
+            while len(packing) >= PACK_SIZE or (packing and not upstream):
+                group, packing = packing[:PACK_SIZE], packing[PACK_SIZE:]
+                packs[threads.submit(news_assistant.analyze_packed, group)] = group
+
+            finished, _ = wait(list(pending) + list(packs), return_when=FIRST_COMPLETED)
+            for future in finished:
+                if future in packs:
+                    group = packs.pop(future)
+                    try:
+                        future.result()
+                    except Exception as e:
+                        print(f"Error summarizing {len(group)} packed articles: {str(e)}")
+                        for article in group:
+                            article.error = f"Processing failed: {str(e)}"
+                    for article in group:
+                        done += 1
+                        print(f"Processed {done} of {total}: {article.source_url}")
+                    continue
+
+                stage, article = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    article.error = f"Processing failed: {str(e)}"
+                    print(f"Error processing {article.source_url}: {str(e)}")
+                else:
+                    if stage == CLEAN:
+                        batch.update(article.set_cleaned(*result))
+                    if stage == FETCH and not result:
+                        print(f"Skipping {article.source_url}: {article.error}")
+                    elif stage == FETCH and article.needs_cleaning():
+                        pending[processes.submit(process_page, article.raw, article.content_selectors)] = (CLEAN, article)
+                        continue
+                    elif stage != SUMMARIZE and not (deduplicator and deduplicator.assign(article)):
+                        if pack and news_assistant.can_pack(article):
+                            packing.append(article)
+                        elif summarizer:
+                            pending[summarizer.submit(article)] = (SUMMARIZE, article)
+                        else:
+                            pending[threads.submit(news_assistant.analyze_article, article)] = (SUMMARIZE, article)
+                        continue
+
+                done += 1
+                print(f"Processed {done} of {total}: {article.source_url}")
+
+            cleaning = any(stage == CLEAN for stage, _ in pending.values())
+            if len(batch) >= CACHE_BATCH_SIZE or (batch and not cleaning):
+                cache.put_many(batch)
+                batch = {}
+
+    if deduplicator:
+        for article in deduplicator.resolve():
+            news_assistant.analyze_article(article)
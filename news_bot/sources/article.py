@@ -1,11 +1,15 @@
-from dataclasses import dataclass
-from datetime import datetime
+from dataclasses import dataclass, field
+import time
+from datetime import date, datetime
 from typing import Dict, Any, List, Callable, Optional
 import requests
 from urllib.parse import urljoin
-from bs4 import BeautifulSoup, NavigableString
 import cache
-from sources.fetcher import fetch_page
+from sources.extractor import process_page
+from sources.fetcher import fetch_cached
+
+# Seconds a downloaded article is used without asking the server whether it changed
+REVALIDATE_AFTER = 6 * 60 * 60
 
 
 @dataclass
@@ -19,6 +23,14 @@ class Article:
 	digest: Optional[str] = None
 	raw: Optional[str] = None
 	error: Optional[str] = None
+	max_bytes: Optional[int] = None
+	stop_marker: Optional[str] = None
+	content_selectors: Optional[List[str]] = None
+	cleaned_html: Optional[str] = None
+	# URL of the article telling the same story that was summarized in place of this one
+	duplicate_of: Optional[str] = None
+	# Articles telling the same story, summarized with this one
+	related: List["Article"] = field(default_factory=list)
 
 
 	def cache_key_raw(self):
@@ -30,6 +42,12 @@ class Article:
 	def cache_key_title(self):
 		return "title:" + self.source_url
 
+	def cache_key_text(self):
+		return "text:" + self.source_url
+
+	def cache_key_first_seen(self):
+		return "firstseen:" + self.source_url
+
 
 	def is_cached(self) -> bool:
 		"""Check if the article is cached."""
@@ -40,64 +58,70 @@ class Article:
 			self.error = "No source URL provided"
 			return False
 
-		if self.is_cached():
-			print(f"Content cache: {self.source_url}")
-			self.raw = cache.get(self.cache_key_raw())
-		else:
-			print(f"Content fetch: {self.source_url}")
-			self.raw = fetch_page(self.source_url)
-			if not self.raw:
-				self.error = "Failed to fetch page"
-				return False
-			cache.put(self.cache_key_raw(), self.raw)
+		print(f"Content fetch: {self.source_url}")
+		self.raw, updated = fetch_cached(
+			self.source_url, self.cache_key_raw(), max_age=REVALIDATE_AFTER,
+			max_bytes=self.max_bytes, stop_marker=self.stop_marker
+		)
+		if not self.raw:
+			self.error = "Failed to fetch page"
+			return False
+
+		if updated:
+			# New content, anything derived from the previous version is stale
+			self.cleaned_html = None
+			self.text = None
+			cache.delete(self.cache_key_cleaned())
+			cache.delete(self.cache_key_title())
+			cache.delete(self.cache_key_text())
 
 		return True
 
+	def needs_cleaning(self) -> bool:
+		if self.cleaned_html is not None:
+			return False
+		# Read with their content, which is needed next, so the backend is asked once for both
+		cached = cache.get_many([self.cache_key_cleaned(), self.cache_key_text()])
+		return any(content is None for content in cached.values())
+
 	def cleaned(self) -> str:
-		if cache.has(self.cache_key_cleaned()):
-			return cache.get(self.cache_key_cleaned())
-
-		soup = BeautifulSoup(self.raw, 'html.parser')
-
-		title_tag = soup.find('title')
-		if title_tag:
-			self.title = title_tag.get_text().strip()
-			cache.put(self.cache_key_title(), self.title)
-
-		for element in soup(['header','script', 'style', 'img','picture', 'source', 'head', 'polygon', 'button', 'iframe', 'svg']):
-			element.decompose()
-
-		for li in soup.find_all('li'):
-			for content in li.contents:
-				if isinstance(content, NavigableString) and content.strip() == '':
-					content.extract()
-			if len(li.contents) == 0 or (len(li.contents) == 1 and li.find('a')):
-				li.decompose()
-		for node in soup.find_all('ul'):
-			if len(node.contents) == 0:
-				node.decompose()
-		for node in soup.find_all('a'):
-			if len(node.contents) == 0:
-				node.decompose()
-
-		for node in soup.find_all(['span', 'em', 'i', 'b', 'li', 'ul', 'table', 'nav']):
-			node.unwrap()
-
-		for div in soup.find_all('div'):
-			if not div.find(['article', 'h1', 'h2', 'h3', 'p', 'strong']):
-				div.unwrap()
-
-		for tag in soup.find_all():
-			for attribute in list(tag.attrs):
-				del tag[attribute]
-		text = str(soup)
-		text = ' '.join(text.split())
-		soup = BeautifulSoup(text, 'html.parser')
-
-		# self.text = soup.get_text(separator="\n", strip=True)
-		cleaned = str(soup)
-		cache.put(self.cache_key_cleaned(), cleaned)
-		return cleaned
+		if self.cleaned_html is not None:
+			return self.cleaned_html
+		cleaned = cache.get(self.cache_key_cleaned())
+		if cleaned is not None:
+			return cleaned
+
+		self.process()
+		return self.cleaned_html
+
+	def extracted(self) -> str:
+		"""The plain text of the article body, empty if it could not be told apart from the rest of the page."""
+		if self.text is not None:
+			return self.text
+		text = cache.get(self.cache_key_text())
+		if text is not None:
+			self.text = text
+			return text
+
+		self.process()
+		return self.text
+
+	def content(self) -> str:
+		"""What to summarize: the article text, or the cleaned page if no article text was found."""
+		return self.extracted() or self.cleaned()
+
+	def process(self):
+		cache.put_many(self.set_cleaned(*process_page(self.raw, self.content_selectors)))
+
+	def set_cleaned(self, cleaned: str, title: Optional[str], text: str) -> Dict[str, str]:
+		"""Keep the result of process_page() and return the cache entries to store for it."""
+		self.cleaned_html = cleaned
+		self.text = text
+		entries = {self.cache_key_cleaned(): cleaned, self.cache_key_text(): text}
+		if title is not None:
+			self.title = title
+			entries[self.cache_key_title()] = title
+		return entries
 
 
 	def load_cache(self):
@@ -116,11 +140,23 @@ class Article:
 	def __str__(self) -> str:
 		return f"Article({self.source_name}, {self.source_url}, {self.date}, {self.title})"
 
+	def first_seen(self) -> datetime:
+		"""When the article was first discovered, recorded on the first call.
+
+		Kept in an entry that outlives the raw page by far, so an old article
+		still linked from a section page does not look new again.
+		"""
+		stored = cache.get(self.cache_key_first_seen())
+		if stored is not None:
+			return datetime.fromtimestamp(float(stored))
+		# Articles of older versions have only the creation time of their raw page
+		raw_created = cache.created(self.cache_key_raw())
+		timestamp = raw_created.timestamp() if raw_created else time.time()
+		cache.put(self.cache_key_first_seen(), repr(timestamp))
+		return datetime.fromtimestamp(timestamp)
+
 	def is_from_today(self):
-		age = cache.age(self.cache_key_raw())
-		if age > 0:
-			return False
-		return True
+		return self.first_seen().date() == date.today()
 
 
 
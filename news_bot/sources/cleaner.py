@@ -0,0 +1,317 @@
+from html.entities import html5
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Tuple
+
+# Elements removed together with everything inside them
+DROPPED_TAGS = {'header', 'script', 'style', 'img', 'picture', 'source', 'head', 'polygon', 'button', 'iframe', 'svg'}
+# Elements replaced by their content
+UNWRAPPED_TAGS = {'span', 'em', 'i', 'b', 'li', 'ul', 'table', 'nav'}
+# A div is only kept when it still contains one of these
+CONTENT_TAGS = {'article', 'h1', 'h2', 'h3', 'p', 'strong'}
+
+# Tree building rules of BeautifulSoup's html.parser builder, which the output has to match
+VOID_TAGS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem', 'meta',
+    'param', 'source', 'track', 'wbr', 'basefont', 'bgsound', 'command', 'frame', 'image', 'isindex',
+    'nextid', 'spacer',
+}
+PRESERVE_WHITESPACE_TAGS = {'pre', 'textarea'}
+# Text inside these is not part of the title text
+STRING_CONTAINER_TAGS = {'rt', 'rp', 'style', 'script', 'template'}
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+ENTITIES: Dict[str, str] = {}
+for _name, _character in sorted(html5.items()):
+    ENTITIES.setdefault(_name[:-1] if _name.endswith(';') else _name, _character)
+
+# Kinds of strings in the document
+TEXT, CONTAINED_TEXT, CDATA, COMMENT, DECLARATION, DOCTYPE, PI = range(7)
+
+
+class _Element:
+    __slots__ = ('name', 'start', 'size', 'count', 'removed_li', 'removed_ul',
+                 'has_link', 'has_content', 'strings')
+
+    def __init__(self, name: str, start: int):
+        self.name = name
+        # Position of the start tag in the output
+        self.start = start
+        # Children in the tree, and nodes left in the output once children are unwrapped
+        self.size = 0
+        self.count = 0
+        self.removed_li = 0
+        self.removed_ul = 0
+        self.has_link = False
+        self.has_content = False
+        # Children of list items, as (output position, text) for strings and None for elements
+        self.strings: Optional[list] = [] if name == 'li' else None
+
+
+class _CleaningParser(HTMLParser):
+    """Builds the output while parsing, deciding about each element when it is closed.
+
+    Everything an element contributes to the output follows its start tag, so
+    removing an element truncates the output and unwrapping it leaves out its tags.
+    """
+
+    def __init__(self, clean: bool = True):
+        super().__init__(convert_charrefs=False)
+        self.clean = clean
+        self.out: List[str] = []
+        self.stack = [_Element('[document]', -1)]
+        self.open_counts: Dict[str, int] = {}
+        self.data: List[str] = []
+        # Void elements closed at their start tag, whose end tag is ignored once
+        self.closed_void: List[str] = []
+        self.preserve = 0
+        self.containers = 0
+        self.title: Optional[str] = None
+        self.title_element: Optional[_Element] = None
+        self.title_parts: List[str] = []
+        self.doctypes: List[Tuple[int, bool]] = []
+        # Set when the output does not parse back into the same tree
+        self.unstable = False
+
+    def handle_starttag(self, tag, attrs):
+        self._start(tag)
+        if tag in VOID_TAGS:
+            self._end(tag)
+            self.closed_void.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self._start(tag)
+        self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self.closed_void:
+            self.closed_void.remove(tag)
+        else:
+            self._end(tag)
+
+    def handle_data(self, data):
+        self.data.append(data)
+
+    def handle_charref(self, name):
+        if name.startswith('x'):
+            number = int(name.lstrip('x'), 16)
+        elif name.startswith('X'):
+            number = int(name.lstrip('X'), 16)
+        else:
+            number = int(name)
+        data = None
+        if number < 256:
+            # Numeric references are often meant as windows-1252
+            try:
+                data = bytearray([number]).decode('windows-1252')
+            except UnicodeDecodeError:
+                pass
+        if not data:
+            try:
+                data = chr(number)
+            except (ValueError, OverflowError):
+                pass
+        self.data.append(data or '\N{REPLACEMENT CHARACTER}')
+
+    def handle_entityref(self, name):
+        self.data.append(ENTITIES.get(name, '&' + name))
+
+    def handle_comment(self, data):
+        self._string(data, COMMENT)
+
+    def handle_decl(self, data):
+        self._string(data[len('DOCTYPE '):], DOCTYPE)
+
+    def unknown_decl(self, data):
+        if data.upper().startswith('CDATA['):
+            self._string(data[len('CDATA['):], CDATA)
+        else:
+            self._string(data, DECLARATION)
+
+    def handle_pi(self, data):
+        self._string(data, PI)
+
+    def finish(self) -> None:
+        self.close()
+        self._flush()
+        while len(self.stack) > 1:
+            self._pop()
+
+    def _string(self, data: str, kind: int) -> None:
+        self._flush()
+        self.data.append(data)
+        self._flush(kind)
+
+    def _flush(self, kind: int = TEXT) -> None:
+        if not self.data:
+            return
+        text = ''.join(self.data)
+        self.data = []
+        if not self.preserve and not text.strip(ASCII_SPACES):
+            text = '\n' if '\n' in text else ' '
+        if kind == TEXT and self.containers:
+            kind = CONTAINED_TEXT
+        if self.title_element is not None and kind in (TEXT, CDATA):
+            self.title_parts.append(text)
+
+        if kind <= CONTAINED_TEXT:
+            rendered = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+        elif kind == CDATA:
+            rendered = '<![CDATA[' + text + ']]>'
+        elif kind == COMMENT:
+            rendered = '<!--' + text + '-->'
+        elif kind == DECLARATION:
+            rendered = '<?' + text + '?>'
+        elif kind == DOCTYPE:
+            # Parsed again, a doctype left empty by collapsing the whitespace gets a space
+            self.doctypes.append((len(self.out), not self.preserve and not text.split()))
+            rendered = '<!DOCTYPE ' + text + '>\n'
+        else:
+            rendered = '<?' + text + '>'
+        parent = self.stack[-1]
+        if parent.strings is not None:
+            parent.strings.append((len(self.out), text))
+        parent.size += 1
+        parent.count += 1
+        self.out.append(rendered)
+
+    def _start(self, name: str) -> None:
+        self._flush()
+        parent = self.stack[-1]
+        if parent.strings is not None:
+            parent.strings.append(None)
+        element = _Element(name, len(self.out))
+        self.out.append('')
+        self.stack.append(element)
+        self.open_counts[name] = self.open_counts.get(name, 0) + 1
+        if name in PRESERVE_WHITESPACE_TAGS:
+            self.preserve += 1
+        if name in STRING_CONTAINER_TAGS:
+            self.containers += 1
+        if name == 'title' and self.title is None and self.title_element is None:
+            self.title_element = element
+
+    def _end(self, name: str) -> None:
+        self._flush()
+        if not self.open_counts.get(name):
+            return
+        while self._pop().name != name:
+            pass
+
+    def _pop(self) -> _Element:
+        element = self.stack.pop()
+        name = element.name
+        self.open_counts[name] -= 1
+        if name in PRESERVE_WHITESPACE_TAGS:
+            self.preserve -= 1
+        if name in STRING_CONTAINER_TAGS:
+            self.containers -= 1
+        if element is self.title_element:
+            self.title = ''.join(self.title_parts).strip()
+            self.title_element = None
+        if self.clean:
+            self._close(element)
+        else:
+            self._keep(element)
+        return element
+
+    def _close(self, element: _Element) -> None:
+        """Apply the cleaning rules to an element whose content is complete."""
+        name = element.name
+        parent = self.stack[-1]
+        if name in DROPPED_TAGS:
+            self._truncate(element.start)
+            if parent.strings is not None:
+                parent.strings.pop()
+            return
+
+        parent.size += 1
+        parent.has_link = parent.has_link or name == 'a' or element.has_link
+        if name == 'li':
+            self._strip_list_item(element)
+            removed = element.size == 0 or (element.size == 1 and element.has_link)
+            parent.removed_li += removed
+        elif name == 'ul':
+            removed = element.size == element.removed_li
+            parent.removed_ul += removed
+        elif name == 'a':
+            removed = element.size == element.removed_li + element.removed_ul
+        else:
+            removed = False
+        if removed:
+            self._truncate(element.start)
+            return
+
+        parent.has_content = parent.has_content or name in CONTENT_TAGS or element.has_content
+        if name in UNWRAPPED_TAGS or (name == 'div' and not element.has_content):
+            parent.count += element.count
+        else:
+            self._keep(element)
+
+    def _keep(self, element: _Element) -> None:
+        name = element.name
+        if element.count == 0 and name in VOID_TAGS:
+            self.out[element.start] = '<' + name + '/>'
+        else:
+            if name in VOID_TAGS:
+                # Parsed again this would become an empty element followed by the content
+                self.unstable = True
+            self.out[element.start] = '<' + name + '>'
+            self.out.append('</' + name + '>')
+        self.stack[-1].count += 1
+
+    def _strip_list_item(self, element: _Element) -> None:
+        """Remove whitespace strings directly in a list item.
+
+        Like the loop this replaces, which removed items from the list it was
+        iterating, the child following a removed string is not looked at.
+        """
+        children = element.strings
+        i = 0
+        while i < len(children):
+            child = children[i]
+            if child is not None and child[1].strip() == '':
+                del children[i]
+                self.out[child[0]] = ''
+                element.size -= 1
+                element.count -= 1
+            i += 1
+
+    def _truncate(self, position: int) -> None:
+        del self.out[position:]
+        while self.doctypes and self.doctypes[-1][0] >= position:
+            self.doctypes.pop()
+
+
+def clean_html(raw: str) -> Tuple[str, Optional[str]]:
+    """Strip a page down to its structure and text in a single parse.
+
+    Drops scripts, styles, images, headers and link lists, unwraps inline and
+    layout elements, removes attributes and collapses whitespace. The output is
+    the same the former BeautifulSoup implementation produced.
+
+    Returns:
+        The cleaned HTML and the page title, or None if the page has no title
+    """
+    parser = _CleaningParser()
+    parser.feed(raw)
+    parser.finish()
+    text = ' '.join(''.join(parser.out).split())
+
+    if parser.unstable:
+        # Rare enough to afford a second parse, as the former implementation did
+        reparsed = _CleaningParser(clean=False)
+        reparsed.feed(text)
+        reparsed.finish()
+        return ''.join(reparsed.out), parser.title
+
+    # Parsing the collapsed text again would only change the doctypes
+    positions = []
+    for index, empty in parser.doctypes:
+        if parser.out[index]:
+            prefix = ''.join(parser.out[:index]) + parser.out[index][:-1]
+            positions.append((len(' '.join(prefix.split())), empty))
+    for position, empty in reversed(positions):
+        if empty:
+            text = text[:position - 1] + ' >\n' + text[position:]
+        else:
+            text = text[:position] + '\n' + text[position:]
+    return text, parser.title
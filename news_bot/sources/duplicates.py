@@ -0,0 +1,195 @@
+import json
+import os
+import random
+import re
+import time
+import zlib
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from sources.article import Article
+from sources.extractor import TAG_PATTERN
+
+SIGNATURES_PATH = Path.home() / ".news-bot" / "signatures.json"
+# Articles not seen for this long are dropped from the index
+FORGET_AFTER = 7 * 24 * 60 * 60
+
+# Words per shingle
+SHINGLE_SIZE = 5
+# MinHash values per signature, split into BANDS bands for the LSH lookup. With
+# 16 bands of 4 rows, pairs from a Jaccard similarity of about 0.5 become candidates
+NUM_HASHES = 64
+BANDS = 16
+ROWS = NUM_HASHES // BANDS
+# Estimated Jaccard similarity of the shingles from which two articles count as the same story
+SIMILARITY_THRESHOLD = 0.6
+# Shorter texts are left alone, templated police reports and the like look alike without being the same story
+MIN_WORDS = 50
+# Words of a text taken into account, the beginning of a story tells it apart well enough
+MAX_WORDS = 1000
+
+WORD_PATTERN = re.compile(r"\w+")
+# Fixed, so signatures stay comparable across runs
+_rng = random.Random(20240501)
+_MASKS = [_rng.getrandbits(32) for _ in range(NUM_HASHES)]
+
+
+def signature(text: str) -> Optional[List[int]]:
+    """MinHash signature of the word shingles of a text, None if the text is too short."""
+    words = WORD_PATTERN.findall(TAG_PATTERN.sub(' ', text).lower())[:MAX_WORDS]
+    if len(words) < MIN_WORDS:
+        return None
+    hashes = {zlib.crc32(' '.join(words[i:i + SHINGLE_SIZE]).encode('utf-8'))
+              for i in range(len(words) - SHINGLE_SIZE + 1)}
+    # XOR with random masks permutes the uniformly distributed shingle hashes
+    return [min(h ^ mask for h in hashes) for mask in _MASKS]
+
+
+def similarity(a: List[int], b: List[int]) -> float:
+    """Estimated Jaccard similarity of the shingles behind two signatures."""
+    return sum(x == y for x, y in zip(a, b)) / NUM_HASHES
+
+
+def _bands(sig: List[int]) -> List[Tuple[int, ...]]:
+    return [(band,) + tuple(sig[band * ROWS:(band + 1) * ROWS]) for band in range(BANDS)]
+
+
+class Deduplicator:
+    """Finds articles telling the same story as another one, across sources and runs.
+
+    Within a run, the first article of a story is its representative: it is
+    summarized, and the others are attached to it in Article.related and get
+    its summary instead of a request of their own. Signatures and summaries
+    are kept in a persistent index. An article repeating a story summarized
+    by an earlier run of the same day is attached to that story's article
+    if it is part of this run as well. Otherwise, and for stories of earlier
+    days, which may have moved on since, it is summarized itself.
+    """
+
+    def __init__(self, path: Path = SIGNATURES_PATH):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        self.buckets: Dict[Tuple[int, ...], List[str]] = {}
+        self.articles: Dict[str, Article] = {}
+        self.duplicates: List[Article] = []
+        # Duplicates of stories summarized by an earlier run today
+        self.earlier: List[Article] = []
+        self.reused = 0
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error reading signature index {self.path}: {e}")
+            return
+        for url, entry in entries.items():
+            self._index(url, entry)
+
+    def _index(self, url: str, entry: Dict) -> None:
+        self.entries[url] = entry
+        for band in _bands(entry['signature']):
+            self.buckets.setdefault(band, []).append(url)
+
+    def _find(self, url: str, sig: List[int]) -> Optional[str]:
+        """URL of the most similar other article in the index, if it is similar enough."""
+        candidates = {other for band in _bands(sig) for other in self.buckets.get(band, ()) if other != url}
+        best, best_similarity = None, SIMILARITY_THRESHOLD
+        for other in candidates:
+            score = similarity(sig, self.entries[other]['signature'])
+            if score >= best_similarity:
+                best, best_similarity = other, score
+        return best
+
+    def assign(self, article: Article) -> bool:
+        """Check the article for a story already known, returning True if it needs no summary of its own."""
+        sig = signature(article.content())
+        if sig is None:
+            return False
+        url = article.source_url
+        match = self._find(url, sig)
+        if url not in self.entries or self.entries[url]['signature'] != sig:
+            # Buckets of a former signature are left behind, candidates are checked against the current one
+            self._index(url, {'signature': sig, 'source': article.source_name})
+        self.entries[url]['seen'] = time.time()
+
+        # The article of the story, following duplicates to the one summarized for it
+        while match in self.articles and self.articles[match].duplicate_of:
+            match = self.articles[match].duplicate_of
+        if match == url:
+            match = None
+
+        if match in self.articles:
+            representative = self.articles[match]
+            print(f"Same story as {representative.source_url}: {url}")
+            article.duplicate_of = representative.source_url
+            representative.related.append(article)
+            self.duplicates.append(article)
+            self.articles[url] = article
+            return True
+
+        self.articles[url] = article
+        entry = self.entries[match] if match else {}
+        if entry.get('summary') and entry.get('day') == date.today().isoformat():
+            print(f"Same story as {match} of an earlier run: {url}")
+            article.duplicate_of = match
+            article.summary = entry['summary']
+            self.earlier.append(article)
+            return True
+        return False
+
+    def resolve(self) -> List[Article]:
+        """Give the duplicates the summary of their representative and record the summaries in the index.
+
+        Called once all articles of a run were assigned, a story's article of
+        an earlier run may be among the last of them.
+
+        Returns:
+            Duplicates whose representative failed or is not part of this run, to be summarized themselves
+        """
+        orphans = []
+        for article in self.earlier:
+            # The story's article of the earlier run may have been taken up later in this run
+            representative = self.articles.get(article.duplicate_of)
+            if representative is not None and representative.summary and not representative.duplicate_of:
+                article.duplicate_of = representative.source_url
+                article.summary = representative.summary
+                representative.related.append(article)
+                self.reused += 1
+            else:
+                # The digest would show the earlier article's summary under this article's headline
+                print(f"Summarizing {article.source_url} itself, the article of the same story is not part of this run")
+                article.duplicate_of = None
+                article.summary = None
+                orphans.append(article)
+        self.earlier = []
+        for article in self.duplicates:
+            representative = self.articles[article.duplicate_of]
+            if representative.summary:
+                article.summary = representative.summary
+            elif representative.error:
+                print(f"Summarizing {article.source_url} itself, the article of the same story failed")
+                article.duplicate_of = None
+                representative.related.remove(article)
+                orphans.append(article)
+        self.duplicates = []
+        today = date.today().isoformat()
+        for url, article in self.articles.items():
+            if article.summary and url in self.entries and not article.duplicate_of:
+                self.entries[url]['summary'] = article.summary
+                self.entries[url]['day'] = today
+        return orphans
+
+    def save(self) -> None:
+        """Write the index, dropping articles not seen for FORGET_AFTER."""
+        now = time.time()
+        entries = {url: entry for url, entry in self.entries.items() if now - entry.get('seen', now) < FORGET_AFTER}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.path)
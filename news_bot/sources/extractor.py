@@ -0,0 +1,215 @@
+import html
+import json
+import re
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Tuple
+
+from bs4 import BeautifulSoup
+
+from sources.cleaner import VOID_TAGS, clean_html
+
+# Extracted text shorter than this is not trusted to be the article
+MIN_TEXT_LENGTH = 200
+# Shorter paragraphs do not count towards the score of the block around them
+MIN_PARAGRAPH_LENGTH = 25
+# Paragraphs with a larger share of link text are navigation or teasers
+MAX_LINK_DENSITY = 0.5
+# Rough size of a model token, for reporting
+CHARS_PER_TOKEN = 4
+
+# Elements whose text is never part of the article
+SKIPPED_TAGS = {
+    'script', 'style', 'noscript', 'template', 'svg', 'head', 'header', 'footer', 'nav', 'aside',
+    'form', 'button', 'iframe', 'select', 'textarea',
+}
+# Elements starting a new paragraph
+BLOCK_TAGS = {
+    'address', 'article', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt', 'figcaption', 'figure',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'li', 'main', 'ol', 'p', 'pre', 'section', 'table',
+    'td', 'th', 'tr', 'ul',
+}
+# Elements that can hold the article body
+CONTAINER_TAGS = {'article', 'main', 'section', 'div', 'td', 'blockquote', 'body'}
+HEADING_TAGS = {'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+
+JSON_LD_PATTERN = re.compile(r'<script[^>]+application/ld\+json[^>]*>(.*?)</script>', re.IGNORECASE | re.DOTALL)
+TAG_PATTERN = re.compile(r'<[^>]+>')
+
+
+class _Paragraph:
+    __slots__ = ('text', 'link_density', 'ancestors', 'heading')
+
+    def __init__(self, text: str, link_density: float, ancestors: Tuple[int, ...], heading: bool):
+        self.text = text
+        self.link_density = link_density
+        # Indexes of the open elements, outermost first
+        self.ancestors = ancestors
+        self.heading = heading
+
+
+class _ParagraphParser(HTMLParser):
+    """Splits a page into paragraphs of plain text, remembering the elements around each."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tags: List[str] = []
+        self.stack: List[int] = []
+        self.skipped = 0
+        self.links = 0
+        self.headings = 0
+        self.text: List[str] = []
+        self.link_text: List[str] = []
+        self.paragraphs: List[_Paragraph] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self._flush()
+        if tag in VOID_TAGS:
+            return
+        self.stack.append(len(self.tags))
+        self.tags.append(tag)
+        self._track(tag, 1)
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if tag in BLOCK_TAGS:
+            self._flush()
+        if tag not in VOID_TAGS and any(self.tags[i] == tag for i in self.stack):
+            while self.stack:
+                name = self.tags[self.stack.pop()]
+                self._track(name, -1)
+                if name == tag:
+                    break
+
+    def handle_data(self, data):
+        if self.skipped:
+            return
+        self.text.append(data)
+        if self.links:
+            self.link_text.append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+    def _track(self, tag: str, change: int) -> None:
+        if tag in SKIPPED_TAGS:
+            self.skipped += change
+        elif tag == 'a':
+            self.links += change
+        elif tag in HEADING_TAGS:
+            self.headings += change
+
+    def _flush(self) -> None:
+        text = ' '.join(''.join(self.text).split())
+        if text:
+            links = len(' '.join(''.join(self.link_text).split()))
+            self.paragraphs.append(_Paragraph(text, links / len(text), tuple(self.stack), self.headings > 0))
+        self.text = []
+        self.link_text = []
+
+
+def _parse(raw: str) -> _ParagraphParser:
+    parser = _ParagraphParser()
+    parser.feed(raw)
+    parser.close()
+    return parser
+
+
+def _join(paragraphs: List[_Paragraph]) -> str:
+    return '\n'.join(p.text for p in paragraphs if p.heading or p.link_density <= MAX_LINK_DENSITY)
+
+
+def _selected_text(raw: str, selectors: List[str]) -> str:
+    """Text of the elements matched by the first of the CSS selectors that matches any."""
+    soup = BeautifulSoup(raw, 'html.parser')
+    for selector in selectors:
+        try:
+            elements = soup.select(selector)
+        except Exception as e:
+            print(f"Invalid content selector {selector!r}: {str(e)}")
+            continue
+        text = '\n'.join(filter(None, (_join(_parse(str(element)).paragraphs) for element in elements)))
+        if text:
+            return text
+    return ''
+
+
+def _json_ld_text(raw: str) -> str:
+    """The longest articleBody found in the JSON-LD metadata of a page."""
+    body = ''
+    for match in JSON_LD_PATTERN.finditer(raw):
+        try:
+            nodes = [json.loads(match.group(1), strict=False)]
+        except ValueError:
+            continue
+        while nodes:
+            node = nodes.pop()
+            if isinstance(node, list):
+                nodes.extend(node)
+            elif isinstance(node, dict):
+                value = node.get('articleBody')
+                if isinstance(value, str) and len(value) > len(body):
+                    body = value
+                nodes.extend(v for v in node.values() if isinstance(v, (dict, list)))
+    # Some sites put HTML into the body
+    body = TAG_PATTERN.sub(' ', html.unescape(body))
+    return '\n'.join(' '.join(line.split()) for line in body.splitlines() if line.strip())
+
+
+def _densest_text(raw: str) -> str:
+    """Text of the <article> element, or else of the block with the most paragraph text.
+
+    Like Readability, paragraphs score for the two blocks around them by their
+    length and number of commas, and link-heavy paragraphs are ignored.
+    """
+    parser = _parse(raw)
+    paragraphs = parser.paragraphs
+    scores: Dict[int, float] = {}
+    articles: Dict[int, int] = {}
+    for paragraph in paragraphs:
+        if len(paragraph.text) < MIN_PARAGRAPH_LENGTH or paragraph.link_density > MAX_LINK_DENSITY:
+            continue
+        score = 1 + paragraph.text.count(',') + min(len(paragraph.text) // 100, 3)
+        containers = [i for i in reversed(paragraph.ancestors) if parser.tags[i] in CONTAINER_TAGS]
+        for level, element in enumerate(containers[:2]):
+            scores[element] = scores.get(element, 0) + score / (level + 1)
+        for element in containers:
+            if parser.tags[element] == 'article':
+                articles[element] = articles.get(element, 0) + len(paragraph.text)
+
+    best = max(articles, key=articles.get, default=None)
+    if best is None or articles[best] < MIN_TEXT_LENGTH:
+        best = max(scores, key=scores.get, default=None)
+    if best is None:
+        return ''
+    return _join([p for p in paragraphs if best in p.ancestors])
+
+
+def extract_text(raw: str, selectors: Optional[List[str]] = None) -> str:
+    """Find the article body of a page and return it as plain text, one paragraph per line.
+
+    Tries the source's CSS selectors, the articleBody of JSON-LD metadata, the
+    <article> element and the block with the most paragraph text, in this order.
+    Returns an empty string when none of them finds enough text.
+    """
+    extractors = [lambda: _selected_text(raw, selectors)] if selectors else []
+    extractors += [lambda: _json_ld_text(raw), lambda: _densest_text(raw)]
+    for extract in extractors:
+        text = extract()
+        if len(text) >= MIN_TEXT_LENGTH:
+            return text
+    return ''
+
+
+def process_page(raw: str, selectors: Optional[List[str]] = None) -> Tuple[str, Optional[str], str]:
+    """Clean a page and extract its article text, returning the cleaned HTML, title and text."""
+    cleaned, title = clean_html(raw)
+    return cleaned, title, extract_text(raw, selectors)
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN
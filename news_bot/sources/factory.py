@@ -1,12 +1,19 @@
 import os
-from typing import Dict, Type, List
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, Type, List, Any
+import yaml
+from .article import Article
 from .base import BaseNewsFetcher
 
+# Seconds the discovery of all source index pages may take before slow sources are skipped
+DISCOVERY_TIMEOUT = 30
+
 class NewsFetcherFactory:
     def __init__(self, config_dir: str = "config/sources"):
         self.config_dir = os.path.abspath(config_dir)
         print(f"Looking for configs in: {self.config_dir}")
         self.fetcher_class = BaseNewsFetcher
+        self._configs: Dict[str, Dict[str, Any]] = {}
 
     def get_available_sources(self) -> List[str]:
         if not os.path.exists(self.config_dir):
@@ -20,9 +27,49 @@ class NewsFetcherFactory:
                 sources.append(source)
         return sorted(sources)
 
-    def create_fetcher(self, source: str) -> BaseNewsFetcher:
+    def load_config(self, source: str) -> Dict[str, Any]:
+        """Load the YAML config of a source, parsing each file only once."""
+        if source in self._configs:
+            return self._configs[source]
+
         config_path = os.path.join(self.config_dir, f"{source}.yaml")
         if not os.path.exists(config_path):
             raise FileNotFoundError(f"Config file not found: {config_path}")
-            
-        return self.fetcher_class(source, config_path)
\ No newline at end of file
+
+        with open(config_path, 'r', encoding='utf-8') as f:
+            self._configs[source] = yaml.safe_load(f)
+        return self._configs[source]
+
+    def create_fetcher(self, source: str) -> BaseNewsFetcher:
+        return self.fetcher_class(source, self.load_config(source))
+
+    def discover_articles(self, sources: List[str], timeout: float = DISCOVERY_TIMEOUT) -> List[Article]:
+        """Fetch the index pages of all sources in parallel.
+
+        Sources that fail or don't finish within the timeout are skipped.
+        An article linked from several sources is returned once.
+        """
+        if not sources:
+            return []
+
+        executor = ThreadPoolExecutor(max_workers=len(sources))
+        futures = {executor.submit(self._discover_source, source): source for source in sources}
+        done, not_done = wait(futures, timeout=timeout)
+        # Don't wait for stuck sources, their requests time out on their own
+        executor.shutdown(wait=False)
+
+        articles = {}
+        for future, source in futures.items():
+            if future in not_done:
+                future.cancel()
+                print(f"Skipped source {source}: no response within {timeout}s")
+                continue
+            try:
+                for article in future.result():
+                    articles.setdefault(article.source_url, article)
+            except Exception as e:
+                print(f"Skipped source {source}: {str(e)}")
+        return list(articles.values())
+
+    def _discover_source(self, source: str) -> List[Article]:
+        return self.create_fetcher(source).fetch_articles()
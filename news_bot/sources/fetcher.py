@@ -1,8 +1,69 @@
-from typing import Dict, Any, List, Callable, Optional
+from typing import Dict, Any, List, Callable, Optional, Tuple
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from html.parser import HTMLParser
 from urllib.parse import urljoin
 from bs4 import BeautifulSoup, NavigableString
 import cache
+from sources.scheduler import scheduler
+from sources.urls import canonicalize_url
+
+# Number of hosts kept in the connection pool
+POOL_CONNECTIONS = 10
+# Maximum number of open connections per host
+POOL_MAXSIZE = 8
+# Bytes read at a time from streamed downloads
+CHUNK_SIZE = 16 * 1024
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_connection_counts = {"opened": 0, "requests": 0}
+_download_counts = {"truncated": 0, "bytes_saved": 0}
+_counts_lock = threading.Lock()
+
+
+def _count(name: str) -> None:
+    with _counts_lock:
+        _connection_counts[name] += 1
+
+
+class _CountingHTTPConnection(HTTPConnection):
+    def connect(self):
+        _count("opened")
+        super().connect()
+
+
+class _CountingHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        _count("opened")
+        super().connect()
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _CountingHTTPConnection
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _CountingHTTPSConnection
+
+
+class _PooledAdapter(HTTPAdapter):
+    """HTTP adapter that counts requests and newly opened connections."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+    def send(self, request, **kwargs):
+        _count("requests")
+        return super().send(request, **kwargs)
 
 
 def create_error_response(url: str, error: str) -> Dict[str, Any]:
@@ -25,9 +86,41 @@ def create_success_response(url: str, content: str, cached: bool = False) -> Dic
     }
 
 
+def configure_pool(pool_connections: int = POOL_CONNECTIONS, pool_maxsize: int = POOL_MAXSIZE) -> None:
+    """Set the pool sizes of the shared session. Should be called before the first fetch."""
+    global POOL_CONNECTIONS, POOL_MAXSIZE, _session
+    with _session_lock:
+        POOL_CONNECTIONS = pool_connections
+        POOL_MAXSIZE = pool_maxsize
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def get_session() -> requests.Session:
+    """Get the process-wide session, so connections are kept alive between fetches."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = _create_session()
+        return _session
+
+
+def connection_stats() -> Dict[str, int]:
+    """Count the requests sent and the connections opened and reused for them."""
+    with _counts_lock:
+        stats = dict(_connection_counts)
+    stats["reused"] = max(0, stats["requests"] - stats["opened"])
+    return stats
+
+
 def _create_session() -> requests.Session:
     """Create a configured requests session."""
     session = requests.Session()
+    # Block instead of opening extra connections, which caps the connections per host
+    adapter = _PooledAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, pool_block=True)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
     session.headers.update({
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
         'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
@@ -44,11 +137,16 @@ def _create_session() -> requests.Session:
     return session
 
 
-def fetch_page(url: str) -> Optional[str]:
-    """Fetch and parse a page, returning the BeautifulSoup object or None on error."""
+def fetch_page(url: str, cache_key: Optional[str] = None, max_age: Optional[float] = None) -> Optional[str]:
+    """Fetch a page, returning its HTML or None on error.
+
+    With a cache_key the page is revalidated against the cache, see fetch_cached().
+    """
+    if cache_key:
+        return fetch_cached(url, cache_key, max_age)[0]
     try:
-        session = _create_session()
-        response = session.get(url, timeout=10)
+        session = get_session()
+        response = scheduler.get(session, url, timeout=10)
         response.raise_for_status()
         return response.text
     except Exception as e:
@@ -56,6 +154,109 @@ def fetch_page(url: str) -> Optional[str]:
         return None
 
 
+def fetch_cached(url: str, cache_key: str, max_age: Optional[float] = None,
+                 max_bytes: Optional[int] = None, stop_marker: Optional[str] = None) -> Tuple[Optional[str], bool]:
+    """Fetch a page through the cache using HTTP conditional requests.
+
+    The ETag/Last-Modified validators are stored along with the cached page and
+    sent as If-None-Match/If-Modified-Since on the next fetch. A 304 response is
+    served from the cache. Within max_age seconds after the last check the cached
+    page is returned without any request.
+
+    With max_bytes or stop_marker the body is streamed and the download stops
+    once the limit is reached or the marker (e.g. "</article>") has been read.
+
+    Returns:
+        The page content (or None on error) and whether the cached content changed
+    """
+    # The cached page is read once here, it is returned or compared against in most cases
+    cached = cache.get(cache_key)
+    validators = cache.get_validators(cache_key) if cached is not None else None
+    headers = {}
+    if validators is not None:
+        checked = validators.get('checked')
+        if checked is None:
+            created = cache.created(cache_key)
+            checked = created.timestamp() if created else 0
+        if max_age is not None and time.time() - checked < max_age:
+            return cached, False
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+
+    stream = bool(max_bytes or stop_marker)
+    try:
+        session = get_session()
+        response = scheduler.get(session, url, headers=headers, timeout=10, stream=stream)
+        if response.status_code == 304:
+            response.close()
+            content = cached
+            if content is not None:
+                print(f"Not modified: {url}")
+                cache.put_validators(cache_key, {**validators, 'checked': time.time()})
+                return content, False
+            response = scheduler.get(session, url, timeout=10, stream=stream)
+        with response:
+            response.raise_for_status()
+            content = _read_body(response, max_bytes, stop_marker) if stream else response.text
+    except Exception as e:
+        print(f"Error fetching page {url}: {str(e)}")
+        return None, False
+
+    changed = validators is None or content != cached
+    if changed:
+        cache.put(cache_key, content)
+    cache.put_validators(cache_key, {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'checked': time.time(),
+    })
+    return content, changed
+
+
+def _read_body(response: requests.Response, max_bytes: Optional[int], stop_marker: Optional[str]) -> str:
+    """Read a streamed response until max_bytes or the end of stop_marker is reached."""
+    encoding = response.encoding or 'utf-8'
+    marker = stop_marker.encode(encoding, errors='ignore') if stop_marker else b''
+    body = bytearray()
+    cut = None
+    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+        search_from = max(0, len(body) - len(marker) + 1)
+        body.extend(chunk)
+        if marker:
+            position = body.find(marker, search_from)
+            if position != -1:
+                cut = position + len(marker)
+                break
+        if max_bytes and len(body) >= max_bytes:
+            cut = max_bytes
+            break
+
+    if cut is not None:
+        _count_truncated(response)
+        del body[cut:]
+    return bytes(body).decode(encoding, errors='replace')
+
+
+def _count_truncated(response: requests.Response) -> None:
+    """Record a download that was cut off, and how many bytes were not transferred."""
+    saved = 0
+    content_length = response.headers.get('Content-Length')
+    if content_length and content_length.isdigit():
+        # tell() counts the bytes read from the wire, like Content-Length
+        saved = max(0, int(content_length) - response.raw.tell())
+    with _counts_lock:
+        _download_counts["truncated"] += 1
+        _download_counts["bytes_saved"] += saved
+
+
+def download_stats() -> Dict[str, int]:
+    """Count the downloads cut off early and the bytes that were not downloaded because of it."""
+    with _counts_lock:
+        return dict(_download_counts)
+
+
 def fetch_article(url: str) -> Dict[str, Any]:
     """Fetch and clean content from a URL, removing only scripts and styles."""
 
@@ -67,8 +268,8 @@ def fetch_article(url: str) -> Dict[str, Any]:
 
     try:
         print(f"Fetching article from {url}")
-        session = _create_session()
-        response = session.get(url, timeout=10)
+        session = get_session()
+        response = scheduler.get(session, url, timeout=10)
 
         if response.status_code == 410:
             return create_error_response(url, "Article has been permanently removed")
@@ -105,29 +306,52 @@ def fetch_article(url: str) -> Dict[str, Any]:
         print(f"Error fetching {url}: {str(e)}")
         return create_error_response(url, str(e))
 
+class _LinkParser(HTMLParser):
+    """Collects the href of every link, without building a document tree."""
+
+    def __init__(self):
+        super().__init__()
+        self.links: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            href = dict(attrs).get('href')
+            if href:
+                self.links.append(href)
+
+
+def extract_links(html: str) -> List[str]:
+    parser = _LinkParser()
+    parser.feed(html)
+    parser.close()
+    return parser.links
+
+
 def extract_urls(url: str, is_valid_url: Callable[[str], bool]) -> List[str]:
     """Extract URLs from a page that match the given validation function."""
-    raw = fetch_page(url)
-    soup = BeautifulSoup(raw, 'html.parser') if raw else None
-    if not soup:
+    raw = fetch_page(url, cache_key="index:" + url)
+    if not raw:
         return []
 
     # Get all links
-    all_links = soup.find_all('a', href=True)
+    all_links = extract_links(raw)
     print(f"Found {len(all_links)} total links")
 
     # Filter for valid URLs
     valid_urls = set()
-    for link in all_links:
-        href = link['href']
+    seen = set()
+    for href in all_links:
         if href.startswith('/'):
             # Use the base domain from the input URL
             href = urljoin(url, href)
         elif not href.startswith(('http://', 'https://')):
             continue
 
-        if is_valid_url(href):
-            valid_urls.add(href)
+        href = canonicalize_url(href)
+        if href not in seen:
+            seen.add(href)
+            if is_valid_url(href):
+                valid_urls.add(href)
 
     # Print unique URLs
     print("\nFound valid URLs:")
@@ -136,4 +360,3 @@ def extract_urls(url: str, is_valid_url: Callable[[str], bool]) -> List[str]:
 
     print(f"\nTotal unique valid URLs found: {len(valid_urls)}")
     return list(valid_urls)
-
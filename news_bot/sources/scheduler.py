@@ -0,0 +1,159 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Optional
+from urllib.parse import urlparse
+import requests
+
+# Defaults for hosts without a rate_limit/retry section in their source config
+DEFAULT_REQUESTS_PER_SECOND = 2.0
+DEFAULT_BURST = 4
+DEFAULT_MAX_ATTEMPTS = 4
+DEFAULT_BACKOFF = 1.0
+# Upper bound for a single backoff or Retry-After wait in seconds
+MAX_BACKOFF = 60.0
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Thread-safe token bucket pacing the requests to one host.
+
+    The rate is halved when the host signals overload and recovers slowly
+    on successful requests, up to the configured rate.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a request may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Hold back all requests to the host for the given time."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def slow_down(self) -> None:
+        with self._lock:
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+
+    def speed_up(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+
+class RequestScheduler:
+    """Paces requests per host and retries them with jittered exponential backoff."""
+
+    def __init__(self):
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._retry: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def configure_host(self, host: str, rate_limit: Optional[Dict[str, Any]] = None,
+                       retry: Optional[Dict[str, Any]] = None) -> None:
+        """Set the rate limit and retry policy of a host from a source config.
+
+        A host configured again with the same rate limit, as on every poll of
+        the daemon, keeps its bucket and with it the rate it slowed down to.
+        """
+        rate_limit = rate_limit or {}
+        rate = float(rate_limit.get('requests_per_second', DEFAULT_REQUESTS_PER_SECOND))
+        burst = int(rate_limit.get('burst', DEFAULT_BURST))
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None or bucket.max_rate != rate or bucket.burst != max(1, burst):
+                self._buckets[host] = TokenBucket(rate, burst)
+            self._retry[host] = retry or {}
+
+    def _bucket(self, host: str) -> TokenBucket:
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(DEFAULT_REQUESTS_PER_SECOND, DEFAULT_BURST)
+            return self._buckets[host]
+
+    def get(self, session: requests.Session, url: str, **kwargs) -> requests.Response:
+        """Send a GET request once the host allows it, retrying on overload and timeouts.
+
+        Returns the last response, or raises the last exception when all attempts failed.
+        """
+        host = urlparse(url).hostname or ''
+        bucket = self._bucket(host)
+        retry = self._retry.get(host, {})
+        max_attempts = max(1, int(retry.get('max_attempts', DEFAULT_MAX_ATTEMPTS)))
+        backoff = float(retry.get('backoff', DEFAULT_BACKOFF))
+
+        for attempt in range(1, max_attempts + 1):
+            bucket.acquire()
+            try:
+                response = session.get(url, **kwargs)
+            except (requests.Timeout, requests.ConnectionError) as e:
+                if attempt == max_attempts:
+                    raise
+                wait = _backoff(backoff, attempt)
+                print(f"Retrying {url} in {wait:.1f}s after error: {str(e)}")
+                time.sleep(wait)
+                continue
+
+            if response.status_code not in RETRY_STATUS_CODES:
+                bucket.speed_up()
+                return response
+            if attempt == max_attempts:
+                return response
+
+            wait = _backoff(backoff, attempt)
+            retry_after = _parse_retry_after(response.headers.get('Retry-After'))
+            if response.status_code in (429, 503):
+                bucket.slow_down()
+                if retry_after is not None:
+                    wait = min(MAX_BACKOFF, max(wait, retry_after))
+                bucket.pause(wait)
+            response.close()
+            print(f"Retrying {url} in {wait:.1f}s after status {response.status_code}")
+            time.sleep(wait)
+
+
+def _backoff(base: float, attempt: int) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(MAX_BACKOFF, base * 2 ** attempt))
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given in seconds or as an HTTP date."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+scheduler = RequestScheduler()
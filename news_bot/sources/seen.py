@@ -0,0 +1,87 @@
+import json
+import os
+import time
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from sources.article import Article
+
+SEEN_DIR = Path.home() / ".news-bot" / "seen"
+# URLs not linked for this long are dropped from the index
+FORGET_AFTER = 30 * 24 * 60 * 60
+
+
+class SeenIndex:
+    """Persistent index of the article URLs of one source, with first-seen timestamps.
+
+    URLs of articles that were processed for a digest also get the time they
+    were first accepted, the others were linked but left out, e.g. as old.
+    """
+
+    def __init__(self, source: str, directory: Path = SEEN_DIR):
+        self.source = source
+        self.path = directory / f"{source}.json"
+        self.last_run: Optional[float] = None
+        self.urls: Dict[str, Dict[str, float]] = {}
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error reading seen index {self.path}: {e}")
+            return
+        self.last_run = data.get('last_run')
+        self.urls = data.get('urls', {})
+
+    def is_known(self, url: str) -> bool:
+        return url in self.urls
+
+    def first_seen(self, url: str) -> Optional[datetime]:
+        entry = self.urls.get(url)
+        return datetime.fromtimestamp(entry['first_seen']) if entry else None
+
+    def accepted_today(self, url: str) -> bool:
+        """Whether the article was processed for a digest of today."""
+        accepted = self.urls.get(url, {}).get('accepted')
+        return accepted is not None and date.fromtimestamp(accepted) == date.today()
+
+    def add(self, urls: Iterable[str], accepted: bool = False) -> None:
+        """Record URLs as seen now, keeping the first-seen and accepted times of known ones."""
+        now = time.time()
+        for url in urls:
+            entry = self.urls.setdefault(url, {'first_seen': now})
+            entry['last_seen'] = now
+            if accepted:
+                entry.setdefault('accepted', now)
+
+    def save(self) -> None:
+        """Write the index, dropping URLs not seen for FORGET_AFTER."""
+        now = time.time()
+        self.last_run = now
+        self.urls = {
+            url: entry for url, entry in self.urls.items()
+            if now - entry.get('last_seen', entry['first_seen']) < FORGET_AFTER
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'last_run': self.last_run, 'urls': self.urls}, f)
+        os.replace(tmp_path, self.path)
+
+
+def record_seen(articles: List[Article], seen: Dict[str, SeenIndex], accepted: Iterable[Article] = ()) -> None:
+    """Add the articles to the seen indexes, marking those processed for the digest as accepted.
+
+    Failed articles stay unknown, so the next run retries them.
+    """
+    accepted_urls = {article.source_url for article in accepted}
+    for article in articles:
+        if not article.error:
+            seen[article.source_name].add([article.source_url], accepted=article.source_url in accepted_urls)
+    for index in seen.values():
+        index.save()
@@ -0,0 +1,105 @@
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional, Pattern
+from urllib.parse import urlsplit, urlunsplit, unquote
+
+# Query parameters that only track where a click came from
+TRACKING_PARAMS = {
+    'fbclid', 'gclid', 'dclid', 'msclkid', 'yclid', 'igshid', 'mc_cid', 'mc_eid',
+    'ocid', 'cmp', 'cmpid', 'xtor', 'ref', 'referer', 'referrer', '_ga', 'share',
+}
+TRACKING_PREFIXES = ('utm_', 'wt_', 'at_', 'itm_', 'pk_')
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def canonicalize_url(url: str) -> str:
+    """Normalize a URL so that links to the same article compare equal.
+
+    Lowercases scheme and host, drops default ports, fragments and tracking
+    query parameters, and keeps the remaining parameters in their order.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if ':' in host:
+        # IPv6 addresses lose their brackets in hostname
+        host = f"[{host}]"
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    netloc = host if port is None or DEFAULT_PORTS.get(scheme) == port else f"{host}:{port}"
+
+    # Filter the raw parameters, so the kept ones stay encoded as they were
+    query = '&'.join(
+        param for param in parts.query.split('&')
+        if param and not _is_tracking_param(unquote(param.split('=', 1)[0]).lower())
+    )
+    return urlunsplit((scheme, netloc, parts.path or '/', query, ''))
+
+
+def _is_tracking_param(name: str) -> bool:
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+class UrlFilter:
+    """Decides which links of a source are articles, compiled once from the source's YAML rules.
+
+    The substring lists become one regular expression each, and the path
+    validation rules are prepared for direct lookups.
+    """
+
+    def __init__(self, skip_patterns: List[str], article_sections: List[str], path_validation: Dict[str, Any]):
+        self._skip = _any_of(skip_patterns)
+        self._sections = _any_of(article_sections)
+        self._min_parts = path_validation['min_parts']
+        self._required_parts = tuple(path_validation.get('required_parts') or ())
+        self._exclude_parts = frozenset(path_validation.get('exclude_parts') or ())
+        self._must_end_with = path_validation.get('must_end_with')
+        self.rejected: Counter = Counter()
+
+    def __call__(self, url: str) -> bool:
+        reason = self.rejection(url)
+        if reason:
+            self.rejected[reason] += 1
+            return False
+        return True
+
+    def rejection(self, url: str) -> Optional[str]:
+        """Why a URL is not an article, or None if it is one."""
+        path = urlsplit(url).path
+        # Skip utility and navigation pages
+        if self._skip and self._skip.search(path):
+            return "skip pattern"
+        # Articles are under specific sections
+        if not self._sections or not self._sections.search(path):
+            return "not in article sections"
+        if not self._valid_path(path):
+            return "invalid path structure"
+        return None
+
+    def _valid_path(self, path: str) -> bool:
+        parts = path.strip("/").split("/")
+        if len(parts) < self._min_parts:
+            return False
+        if tuple(parts[:len(self._required_parts)]) != self._required_parts:
+            return False
+        if self._exclude_parts and not self._exclude_parts.isdisjoint(parts):
+            return False
+        if self._must_end_with and not parts[-1].endswith(self._must_end_with):
+            return False
+        return True
+
+    def report(self) -> str:
+        """Summarize the rejected URLs by reason."""
+        total = sum(self.rejected.values())
+        reasons = ', '.join(f"{count} {reason}" for reason, count in self.rejected.most_common())
+        return f"Ignored {total} URLs" + (f" ({reasons})" if reasons else "")
+
+
+def _any_of(substrings: List[str]) -> Optional[Pattern]:
+    """Compile substrings into one pattern matching any of them."""
+    if not substrings:
+        return None
+    return re.compile('|'.join(re.escape(s) for s in sorted(set(substrings))))